@@ -1,5 +1,6 @@
 # local imports
 import xmatters
+import integrator
 import config
 
 # python3 package imports
@@ -8,54 +9,127 @@ import json
 from logging.handlers import RotatingFileHandler
 
 
-# main process
-def main() -> object:
+# build the request and create a group, executed on the task graph pool
+def create_group(group):
+    group_request = {
+        "targetName": group["name"],
+        "supervisors": identity_cache.get_ids(group["supervisors"]),
+        "observers": []
+    }
+
+    # add the observers
+    for observer in group['observers']:
+        group_request['observers'].append({"name": observer})
+
+    log.info("Creating group:  " + group["name"])
+
+    return xm_group.create_group(group_request)
 
-    groups = members_file.get_rows(["name", "supervisors", "observers"], {"name"}, True, ";")
-    log.info("Executing upload for " + str(len(groups)) + " groups.")
 
-    for group in groups:
+# returns the (shift, member) pairs of an existing group, None if the group doesn't exist or its roster can't be retrieved
+# executed on the task graph pool when upserting
+def get_shift_members(group_name):
+    if not xm_group.get_group(group_name, ""):
+        return None
 
-        if type(group["supervisors"]) is str:
-            group["supervisors"] = [group["supervisors"]]
+    shift_members = set()
+    offset = 0
+    while True:
+        roster = xm_roster.get_roster(group_name, "&offset=" + str(offset) + "&limit=1000")
+        if not roster:
+            log.error("Failed to retrieve the roster of existing group: " + group_name + ", every member will be added")
+            return set()
 
-        group_request = {
-            "targetName": group["name"],
-            "supervisors": xm_person.get_people_ids(group["supervisors"]),
-            "observers": []
-        }
+        for item in roster["data"]:
+            for shift in item.get("shifts", {}).get("data", []):
+                shift_members.add((shift["name"], item["member"]["targetName"]))
 
-        # add the observers
-        if type(group["observers"]) is str:
-            group["observers"] = [group["observers"]]
-        for observer in group['observers']:
-            group_request['observers'].append({"name": observer})
+        offset = offset + roster["count"]
+        if roster["count"] == 0 or offset >= roster["total"]:
+            return shift_members
 
-        log.info("Creating group:  " + group["name"])
 
-        group_response = xm_group.create_group(group_request)
+# create a group unless it already exists, then release its member adds, see get_shift_members
+def upsert_group(task_graph, group, shift_members, skipped):
+    if shift_members is None:
+        task_graph.add(create_group, (group["parent"],), lambda group_response: add_members(task_graph, group, group_response))
+        return
 
-        if group_response:
-            log.info('Group: '+group_request["targetName"]+' successfully created ')
-            members = members_file.get_rows(["name", "shift", "member"], {"name": group_request["targetName"]}, False)
+    log.info('Group: ' + group["parent"]["name"] + ' already exists')
+    skipped["groups"] = skipped["groups"] + 1
+    add_members(task_graph, group, True, shift_members, skipped)
 
-            new_data = []
-            for data in members:
-                new_data.append({
-                    "group_id": data['name'],
-                    "shift_id": data['shift'],
-                    "member_id": data['member'],
-                })
 
-            if len(new_data) > 0:
-                member_response = xm_collection.create_collection(xm_shift.add_member_to_shift, new_data, config.add_members['thread_count'])
-                log.info("Member response: " + str(member_response["response"]))
-                log.info("Member errors: " + str(member_response["errors"]))
-            else:
-                log.info("No requests to execute.")
+# release the member adds of a group once it was created, members already on their shift are skipped
+def add_members(task_graph, group, group_response, shift_members=None, skipped=None):
+    group_name = group["parent"]["name"]
+    if not group_response:
+        log.info('Group: '+group_name+' creation failed.')
+        return
 
+    if shift_members is None:
+        log.info('Group: '+group_name+' successfully created ')
+
+    new_data = []
+    for data in group["rows"]:
+        if shift_members is not None and (data['shift'], data['member']) in shift_members:
+            skipped["members"] = skipped["members"] + 1
+            continue
+
+        new_data.append({
+            "group_id": group_name,
+            "shift_id": data['shift'],
+            "member_id": data['member'],
+        })
+
+    if len(new_data) == 0:
+        log.info("No requests to execute.")
+        return
+
+    # the responses and errors of the group are logged once its last member add completed
+    member_response = {"response": [], "errors": [], "remaining": len(new_data)}
+
+    def add_member_complete(request, response):
+        if response:
+            member_response["response"].append({"request_body": request, "response_body": response})
         else:
-            log.info('Group: '+group_request["targetName"]+' creation failed.')
+            member_response["errors"].append(request)
+
+        member_response["remaining"] = member_response["remaining"] - 1
+        if member_response["remaining"] == 0:
+            log.info("Member response: " + str(member_response["response"]))
+            log.info("Member errors: " + str(member_response["errors"]))
+
+    for request in new_data:
+        task_graph.add(xm_shift.add_member_to_shift, (request["group_id"], request["shift_id"], request["member_id"]),
+                       lambda response, request=request: add_member_complete(request, response))
+
+
+# main process
+def main() -> object:
+
+    # read the file once, grouping the members on the group name
+    groups = members_file.get_groups("name", ["name", "supervisors", "observers"], ["shift", "member"], {"supervisors", "observers"})
+    log.info("Executing upload for " + str(len(groups)) + " groups.")
+
+    # the supervisors repeat across groups, every one not cached yet is requested once in a single batch
+    identity_cache.resolve_names(set(supervisor for group_name in groups for supervisor in groups[group_name]["parent"]["supervisors"]))
+
+    # every group is created concurrently and the members of a group are added to their shifts as soon as their own group exists,
+    # creations and member adds share a single bounded pool, see TaskGraph
+    # when upserting the existing group and its shift roster are retrieved first, so only missing groups and members are created
+    task_graph = integrator.TaskGraph(controller.get_thread_count(config.add_members['thread_count']))
+    skipped = {"groups": 0, "members": 0}
+    for group_name in groups:
+        if config.add_members['upsert']:
+            task_graph.add(get_shift_members, (group_name,), lambda shift_members, group_name=group_name: upsert_group(task_graph, groups[group_name], shift_members, skipped))
+        else:
+            task_graph.add(create_group, (groups[group_name]["parent"],), lambda group_response, group_name=group_name: add_members(task_graph, groups[group_name], group_response))
+
+    task_graph.run()
+    log.info("Executed " + str(task_graph.count) + " requests for " + str(len(groups)) + " groups.")
+    if config.add_members['upsert']:
+        log.info("Skipped existing groups: " + str(skipped["groups"]) + ", existing members: " + str(skipped["members"]))
 
 # entry point when file initiated
 if __name__ == "__main__":
@@ -72,15 +146,25 @@ if __name__ == "__main__":
     log.info("Starting Process: " + time_util.format_date_time_now(start))
 
     # instantiate classes
-    environment = xmatters.xMattersAPI(config.environment["url"], config.environment["username"], config.environment["password"])
+    controller = integrator.ConcurrencyController(config.concurrency["initial"], config.concurrency["minimum"], config.concurrency["maximum"],
+                                                  config.concurrency["target_latency"], config.concurrency["adaptive"])
+    transport = integrator.Transport(config.transport["pool_size"], config.transport["gzip"], controller)
+    environment = integrator.xMattersTransportAPI(config.environment["url"], config.environment["username"], config.environment["password"], transport)
     xm_collection = xmatters.xMattersCollection(environment)
     xm_person = xmatters.xMattersPerson(environment)
     xm_shift = xmatters.xMattersShift(environment)
     xm_group = xmatters.xMattersGroup(environment)
-    members_file = xmatters.Column(config.add_members['file']["file_name"], config.add_members['file']["encoding"])
+    xm_roster = xmatters.xMattersRoster(environment)
+    members_file = integrator.ColumnGroup(config.add_members['file']["file_name"], config.add_members['file']["encoding"])
+    identity_cache = integrator.IdentityCache(xm_person, controller.get_thread_count(config.add_members['thread_count']), config.identity_cache['file_name'],
+                                              config.identity_cache['ttl'], config.identity_cache['max_size'])
 
     # execute the main process
     main()
+    identity_cache.save()
+    log.info('Supervisor lookups served from cache: ' + str(identity_cache.hits) + ', requested: ' + str(identity_cache.misses))
+
+    transport.close()  # logs the connection reuse and the concurrency limits
 
     # end the duration
     end = time_util.get_time_now()
@@ -12,12 +12,69 @@ environment = {
 # Debug:	10
 # Not Set:	0
 
+# shared request budget, the searches and updates of people.py and modify_language.py are all scheduled on a single
+# pool of this size so the total number of requests in flight stays bounded
+collection = {
+    "thread_count": 10
+}
+
+# connections to the instance are kept alive and shared by every request of a script
+transport = {
+    "pool_size": 20,  # connections kept alive, at least the largest thread_count of the script, further requests wait for a free one
+    "gzip": True  # request gzip compressed responses
+}
+
+# requests in flight adapt to the instance, the limit is raised by one while responses are fast and halved on a 429
+# or 5xx response, a Retry-After header holds every request back, when adaptive the pools of every script are sized to
+# the maximum and the thread_count settings only apply when not adaptive
+concurrency = {
+    "adaptive": True,
+    "initial": 5,  # requests in flight at the start
+    "minimum": 1,
+    "maximum": 20,  # at most the pool_size of the transport
+    "target_latency": 2.0  # seconds, slower responses don't raise the limit
+}
+
+# local SQLite snapshot of people searches used by people.py, modify_language.py, dynamic_team_custom_fields.py and
+# dynamic_teams_region.py, a search is only downloaded again once its snapshot is stale
+people_store = {
+    "file_name": "people_store.db",  # absolute path recommended for Windows, Linux can remain as is
+    # seconds a snapshot is trusted before it is downloaded again, 0 downloads on every run, with the probe this is only a
+    # safety net for the changes the probe can't see, without the probe keep it clearly below the schedule interval
+    "ttl": 7 * 24 * 60 * 60,
+    # request the total of each search to decide whether it is downloaded again, only people joining or leaving a
+    # search change its total, other changes to people are picked up once the ttl expires, searches embedding devices,
+    # i.e. dynamic_team_custom_fields.py, are downloaded on every run as device changes can't be probed
+    "probe": True
+}
+
+# person id <-> targetName lookups kept between runs, shared by add_members, dynamic_teams and responses
+identity_cache = {
+    "file_name": "identity_cache.json",  # absolute path recommended for Windows, Linux can remain as is
+    "ttl": 7 * 24 * 60 * 60,  # seconds before a cached person is requested again
+    "max_size": 100000  # least recently used people are evicted above this size
+}
+
 responses = {
     "form": "Form Name",
-    "thread_count": 5,
+    "thread_count": 5,  # threads used to request unknown targetNames
+    "concurrency": 20,  # pages of user deliveries requested at once across every event, at most the pool_size of the transport
+    "event_thread_count": 4,  # number of events whose user deliveries are retrieved at once
     "page_size": 100,
     "file_name": "user_response.csv",  # absolute path recommended for Windows, Linux can remain as is
+    "file_name_new": "user_response_detail.csv",  # absolute path recommended for Windows, Linux can remain as is
     "encoding": "utf-8",
+    "output_format": "csv",  # csv, csv_gzip, jsonl or sqlite, name the files above to match i.e. user_response.csv.gz
+    "buffer_size": 1000,  # number of rows held in memory before they are written to the files
+    "incremental": True,  # only export new events and changed rows since the last run of the day, appending to the files
+    "checkpoint_file_name": "responses_checkpoint.json",  # absolute path recommended for Windows, Linux can remain as is
+    "checkpoint_interval": 50,  # number of events recorded between saves of the checkpoint
+    "backfill": {
+        "enabled": False,  # report on every event from the from date to the to date instead of today, ignores incremental
+        "from": "2020-04-01",
+        "to": "2020-04-15",
+        "slice": "day"  # day or hour, each slice of the range is requested in parallel
+    },
     "logging": {
         "file_name": "log_responses.log",  # absolute path recommended for Windows, Linux can remain as is
         "max_bytes": 16 * 1024 * 1024,  # 16mb is default
@@ -27,8 +84,8 @@ responses = {
 }
 
 people = {
-    "thread_count": 3,
     "page_size": 1000,
+    "max_pages": 20,  # maximum number of search pages requested or held in memory at once
     "properties": {
         # below are key/value property pairs that will be used for the search that exist on user record
         # values must be stored in lists to support multiple values if single needed, only add one value in lists
@@ -43,8 +100,8 @@ people = {
 }
 
 modify_language = {
-    "thread_count": 3,
     "page_size": 1000,
+    "max_pages": 20,  # maximum number of search pages requested or held in memory at once
     "properties": {
         # values must be stored in lists to support multiple values if single needed, only add one value in lists
         "site": ["Site 1", "Site 2"]
@@ -63,6 +120,7 @@ add_members = {
         "encoding": "utf-8"
     },
     "thread_count": 5,
+    "upsert": True,  # only create the groups and add the shift members that don't exist yet
     "logging": {
         "file_name": "log_add_members.log",  # absolute path recommended for Windows, Linux can remain as is
         "max_bytes": 16 * 1024 * 1024,  # 16mb is default
@@ -76,6 +134,9 @@ dynamic_teams = {
         "file_name": "data/dynamic_teams.csv",  # absolute path recommended for Windows, Linux can remain as is
         "encoding": "utf-8"
     },
+    "thread_count": 5,  # supervisors, pages of existing teams and team updates requested at once
+    "page_size": 100,
+    "upsert": True,  # only create missing teams and update the teams that differ from the file, otherwise every team is created
     "logging": {
         "file_name": "log_dynamic_teams.log",  # absolute path recommended for Windows, Linux can remain as is
         "max_bytes": 16 * 1024 * 1024,  # 16mb is default
@@ -84,8 +145,37 @@ dynamic_teams = {
     }
 }
 
-roles = {
+dynamic_team_custom_fields = {
     "thread_count": 5,
+    "page_size": 1000,
+    "max_pages": 10,  # maximum number of search pages requested or held in memory at once
+    "properties": {
+        "device_types": ["Work Phone", "Mobile Phone"],  # VOICE device names that set the voice custom field
+        "custom_fields": ["Has Mobile App", "Has SMS", "Has Voice"],  # order: mobile app, sms, voice
+        "dt_region_field": "Dynamic Team Region"  # only leveraged by dynamic_teams_region.py
+    },
+    "file": {
+        "dt_custom_fields_file_name": "dt_custom_fields.csv",  # absolute path recommended for Windows, Linux can remain as is
+        "output_format": "csv",  # csv, csv_gzip, jsonl or sqlite, only applies to dt_custom_fields_file_name
+        "buffer_size": 1000,  # number of rows held in memory before they are written to the file
+        "dt_region_file_name": "data/dynamic_teams.csv",  # absolute path recommended for Windows, Linux can remain as is
+        "encoding": "utf-8"
+    },
+    "logging": {
+        "file_name": "log_dynamic_team_custom_fields.log",  # absolute path recommended for Windows, Linux can remain as is
+        "max_bytes": 16 * 1024 * 1024,  # 16mb is default
+        "back_up_count": 2,
+        "level": 20
+    }
+}
+
+roles = {
+    "thread_count": 5,  # also bounds the role queries and group rosters retrieved at once
+    "split_role_query": False,  # query the people of each role separately, in parallel, rather than all roles in a single query
+    "skip_unchanged": True,  # skip reconciliation when the mapping, rosters and roles are the same as the last successful run
+    "state_file_name": "roles_state.json",  # absolute path recommended for Windows, Linux can remain as is
+    "incremental": True,  # only look up the group members that changed since the last run, see full_sweep_interval
+    "full_sweep_interval": 24 * 60 * 60,  # seconds between runs that look up every group member, regardless of changes
     "role_mapping": {
         "default_role": "Standard User",  # default role to be assigned if all roles are removed from the user's profile
         "enable_web_ui": True,
@@ -101,3 +191,24 @@ roles = {
     }
 }
 
+moog = {
+    "file_name": "data/moog_users.csv",  # absolute path recommended for Windows, Linux can remain as is, requires an id column
+    "encoding": "utf-8",
+    "thread_count": 5,
+    "chunk_size": 1000,  # number of users read from the file and created at a time
+    "page_size": 1000,
+    "max_pages": 10,  # maximum number of search pages of existing people requested or held in memory at once
+    "person": {
+        "language": "en",
+        "timezone": "US/Pacific",
+        "roles": ["Standard User"],
+        "site": "Default Site",  # name or id of the site, resolved once per run
+        "supervisors": ["moog.supervisor"]  # targetNames or ids of the supervisors, resolved once per run
+    },
+    "logging": {
+        "file_name": "log_create_moog_users.log",  # absolute path recommended for Windows, Linux can remain as is
+        "max_bytes": 16 * 1024 * 1024,  # 16mb is default
+        "back_up_count": 2,
+        "level": 20
+    }
+}
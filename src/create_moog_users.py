@@ -1,13 +1,34 @@
 # local imports
 import xmatters
+import integrator
 import config
 
 # python3 package imports
 import logging
 import json
+import csv
 from logging.handlers import RotatingFileHandler
 
 
+# yields the distinct values of the column in chunks of chunk_size, the file is read as the chunks are consumed
+def get_chunks(file_name, encoding, column, chunk_size):
+    seen = set()
+    chunk = []
+    with open(file_name, encoding=encoding) as f:
+        for row in csv.DictReader(f, delimiter=","):
+            if row[column] in seen:
+                continue
+
+            seen.add(row[column])
+            chunk.append(row[column])
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+
+    if len(chunk) > 0:
+        yield chunk
+
+
 # main process
 def main() -> object:
     """
@@ -15,42 +36,72 @@ def main() -> object:
            process to create a list of users in xMatters
            Built to migrate Moogsoft users from UAT to Prod but could be used for other purposes
 
+           1. Resolve the site and supervisors of the new users from the config
+           2. Retrieve the targetName of every existing person once
+           3. Stream the file in chunks, only creating the users that don't exist yet
     """
 
-    # get a distinct list of users
-    moog_users = moog_file.get_rows(["id"], {}, True, ",")
-    log.debug("Moog_users: " + json.dumps(moog_users))
-
-    update_data = []
-
-    for u in moog_users:
-        log.debug("Processing " + u["id"])
-        targetName = u["id"]
-
-        data = {"data":{
-            "targetName": targetName,
-            "firstName": targetName,
-            "lastName": targetName,
-            "recipientType": "PERSON",
-            "status": "ACTIVE",
-            "language": "en",
-            "timezone": "US/Pacific",
-            "webLogin": targetName,
-            "roles": ["Standard User"],
-            "site": "16f36c72-b00b-456b-b492-4a0757352960",
-            "supervisors": ["65145f9a-aca2-4e61-96e2-84baf5e0bf42"]
+    # 1. the site and supervisors are resolved once, by name or id, rather than hardcoded
+    site = xm_site.get_site(config.moog['person']['site'])
+    if not site:
+        log.error("Site not found: " + config.moog['person']['site'])
+        return "Site Not Found"
+
+    supervisors = xm_person.get_people_ids(config.moog['person']['supervisors'])
+    if len(supervisors) != len(config.moog['person']['supervisors']):
+        log.error("Not every supervisor was found: " + str(config.moog['person']['supervisors']))
+        return "Supervisors Not Found"
+
+    # 2. every existing person, whatever their status, is retrieved once by a single unfiltered search with the pages requested in parallel
+    existing_users = set()
+    for url_filter, person in people_search.search(['?'], config.moog['page_size']):
+        existing_users.add(person["targetName"])
+    if len(people_search.errors) > 0:
+        log.error("Failed pages for search, existing users may be created again: " + str(people_search.errors))
+    log.info("Existing users: " + str(len(existing_users)))
+
+    # 3. stream the file, each chunk only creates the users that don't exist yet
+    skipped = 0
+    created = 0
+    failed = 0
+    for moog_users in get_chunks(config.moog['file_name'], config.moog['encoding'], "id", config.moog['chunk_size']):
+        log.debug("Moog_users: " + json.dumps(moog_users))
+
+        update_data = []
+        for targetName in moog_users:
+            if targetName in existing_users:
+                skipped = skipped + 1
+                continue
+
+            log.debug("Processing " + targetName)
+            data = {"data":{
+                "targetName": targetName,
+                "firstName": targetName,
+                "lastName": targetName,
+                "recipientType": "PERSON",
+                "status": "ACTIVE",
+                "language": config.moog['person']['language'],
+                "timezone": config.moog['person']['timezone'],
+                "webLogin": targetName,
+                "roles": config.moog['person']['roles'],
+                "site": site["id"],
+                "supervisors": supervisors
+                }
             }
-        }
-
-        update_data.append(data)
 
+            update_data.append(data)
 
+        if len(update_data) > 0:
+            person_response = xm_collection.create_collection(xm_person.create_person, update_data, controller.get_thread_count(config.moog['thread_count']))
+            log.debug("Update response: " + str(person_response["response"]))
+            log.info("Update errors: " + str(person_response["errors"]))
 
-    if len(update_data) > 0:
-        person_response = xm_collection.create_collection(xm_person.create_person, update_data, config.dynamic_team_custom_fields['thread_count'])
-        log.info("Update response: " + str(person_response["response"]))
-        log.info("Update errors: " + str(person_response["errors"]))
+            for response in person_response["response"]:
+                existing_users.add(response["request_body"]["data"]["targetName"])
+            created = created + len(person_response["response"])
+            failed = failed + len(person_response["errors"])
 
+    log.info("Users created: " + str(created) + ", failed: " + str(failed) + ", skipped as existing: " + str(skipped))
 
 
 # entry point when file initiated
@@ -69,14 +120,20 @@ if __name__ == "__main__":
     print("Starting Process: " + time_util.format_date_time_now(start))
 
     # instantiate classes
-    environment = xmatters.xMattersAPI(config.environment["url"], config.environment["username"], config.environment["password"])
+    controller = integrator.ConcurrencyController(config.concurrency["initial"], config.concurrency["minimum"], config.concurrency["maximum"],
+                                                  config.concurrency["target_latency"], config.concurrency["adaptive"])
+    transport = integrator.Transport(config.transport["pool_size"], config.transport["gzip"], controller)
+    environment = integrator.xMattersTransportAPI(config.environment["url"], config.environment["username"], config.environment["password"], transport)
     xm_person = xmatters.xMattersPerson(environment)
     xm_collection = xmatters.xMattersCollection(environment)
-    moog_file = xmatters.Column(config.moog['file_name'], config.moog["encoding"])
+    xm_site = xmatters.xMattersSite(environment)
+    people_search = integrator.xMattersPeopleSearch(xm_person, controller.get_thread_count(config.moog['thread_count']), config.moog['max_pages'])
 
     # execute the main process
     main()
 
+    transport.close()  # logs the connection reuse and the concurrency limits
+
     # end the duration
     end = time_util.get_time_now()
     log.info("Process Duration: " + time_util.get_diff(end, start))
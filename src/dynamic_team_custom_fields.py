@@ -1,5 +1,6 @@
 # local imports
 import xmatters
+import integrator
 import config
 
 # python3 package imports
@@ -25,42 +26,12 @@ def main() -> object:
         4. Update xMatters users
     """
 
-    # Get all ACTIVE people and their devices
-    people = []
-
-    param_data = {
-        "url_filter": '?status=ACTIVE&embed=devices'
-    }
-    try:
-        # get initial page of people
-        people_search = xm_person.get_people(param_data['url_filter'] + '&offset=0&limit=' + str(config.dynamic_team_custom_fields['page_size']))
-
-        # if nothing is returned let's skip this search loop
-        if not people_search:
-            log.info('No users found from the instance for search: ' + str(param_data['url_filter']))
-            return "No Users Found"
-
-        # if the total returned from the the search is greater than the config page size, then we have more searching to do
-        if people_search['total'] > config.dynamic_team_custom_fields['page_size']:
-
-            people_collection = xm_collection.get_collection(xm_person.get_people, people_search['total'],
-                                                             config.dynamic_team_custom_fields['page_size'], param_data,
-                                                             config.dynamic_team_custom_fields['thread_count'])
-
-            # log and then concat two arrays
-            log.info("Retrieved " + str(len(people_collection['response'])) + " people from search: " + str(
-                param_data['url_filter']))
-            people = people_collection['response'] + people
-        else:
-            # else, continue on with that initial request and concat the two arrays
-            log.info(
-                "Retrieved " + str(len(people_search['data'])) + " people from search: " + str(param_data['url_filter']))
-            people = people_search['data'] + people
-
-        log.debug('Retrieved people data: ' + json.dumps(people))
-        log.info('Retrieved people count: ' + str(len(people)))
-    except Exception as e:
-        log.error('Exception ' + str(e))
+    # Get all ACTIVE people and their devices, the local snapshot is only downloaded again once it is stale
+    url_filter = '?status=ACTIVE&embed=devices'
+    people_store.refresh([url_filter], config.dynamic_team_custom_fields['page_size'])
+    if len(people_search.errors) > 0:
+        log.error("Failed pages for search: " + str(people_search.errors))
+    people = people_store.get_people(url_filter)
 
     # Check each persons devices as set custom fields
     request_data = []
@@ -71,16 +42,18 @@ def main() -> object:
     custom_fields = config.dynamic_team_custom_fields['properties']['custom_fields']
     log.debug('Custom Fields to populate: ' + str(custom_fields))
 
-    # create csv output file
-    with open(config.dynamic_team_custom_fields['file']['dt_custom_fields_file_name'], 'w', newline='',encoding=config.dynamic_team_custom_fields['file']['encoding']) as csv_file:
-        csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
-
-        # write the csv column headers
-        csv_writer.writerow(['targetName', 'has_mobile_app', 'has_sms', 'has_voice', 'timestamp'])
+    # create the output file in the configured format, the header is written with the first row
+    file_config = config.dynamic_team_custom_fields['file']
+    with integrator.get_sink(file_config['output_format'], file_config['dt_custom_fields_file_name'], file_config['encoding'],
+                             [('targetName', 'string'), ('has_mobile_app', 'boolean'), ('has_sms', 'boolean'), ('has_voice', 'boolean'), ('timestamp', 'date')],
+                             file_config['buffer_size']) as csv_writer:
 
         today_date = str(datetime.date.today().isoformat())
 
+        people_count = 0
         for data in people:
+            people_count = people_count + 1
+            log.debug('Retrieved person data: ' + json.dumps(data))
 
             #reset flags
             has_app=False
@@ -101,8 +74,8 @@ def main() -> object:
 
                 log.debug(data['targetName'] + ' - Has Mobile App: ' + str(has_app) + ' - Has SMS: ' + str(has_sms) + ' - Has Voice: ' + str(has_voice) )
 
-                # write to csv
-                csv_writer.writerow([data['targetName'], has_app, has_sms, has_voice, today_date])
+                # write to the output file
+                csv_writer.write(dict(targetName=data['targetName'], has_mobile_app=has_app, has_sms=has_sms, has_voice=has_voice, timestamp=today_date))
 
                 # if a persons devices have changed
                 if data['properties'][custom_fields[0]] != has_app or data['properties'][custom_fields[1]] != has_sms or data['properties'][custom_fields[2]] != has_voice:
@@ -120,15 +93,25 @@ def main() -> object:
             except Exception as e:
                 log.error('Exception ' + str(e) + ' on line:  ' + str(data))
 
+    if people_count == 0:
+        log.info('No users found from the instance for search: ' + url_filter)
+        return "No Users Found"
+
+    log.info('Retrieved people count: ' + str(people_count))
+
     log.debug('Retrieved request data: ' + json.dumps(request_data))
     log.info('Number of requests for update: ' + str(len(request_data)))
 
     # update custom fields
     if len(request_data) > 0:
         try:
-            person_response = xm_collection.create_collection(xm_person.modify_person, request_data, config.dynamic_team_custom_fields['thread_count'])
+            person_response = xm_collection.create_collection(xm_person.modify_person, request_data, controller.get_thread_count(config.dynamic_team_custom_fields['thread_count']))
             log.debug("Update response: " + str(person_response["response"]))
             log.info("Update errors: " + str(person_response["errors"]))
+
+            # keep the people store in line with the successful updates
+            for response in person_response["response"]:
+                people_store.update_person(response["request_body"]["data"])
         except Exception as e:
             log.error('Exception ' + str(e))
 
@@ -147,13 +130,22 @@ if __name__ == "__main__":
     log.info("Starting Process: " + time_util.format_date_time_now(start))
 
     # instantiate classes
-    environment = xmatters.xMattersAPI(config.environment["url"], config.environment["username"],
-                                       config.environment["password"])
+    controller = integrator.ConcurrencyController(config.concurrency["initial"], config.concurrency["minimum"], config.concurrency["maximum"],
+                                                  config.concurrency["target_latency"], config.concurrency["adaptive"])
+    transport = integrator.Transport(config.transport["pool_size"], config.transport["gzip"], controller)
+    environment = integrator.xMattersTransportAPI(config.environment["url"], config.environment["username"],
+                                                  config.environment["password"], transport)
     xm_person = xmatters.xMattersPerson(environment)
     xm_collection = xmatters.xMattersCollection(environment)
+    people_search = integrator.xMattersPeopleSearch(xm_person, controller.get_thread_count(config.dynamic_team_custom_fields['thread_count']), config.dynamic_team_custom_fields['max_pages'])
+    people_store = integrator.PeopleStore(config.people_store['file_name'], people_search, config.people_store['ttl'],
+                                          config.people_store['probe'], controller.get_thread_count(config.dynamic_team_custom_fields['thread_count']))
 
 
     main()  # execute the main process
+    people_store.close()
+
+    transport.close()  # logs the connection reuse and the concurrency limits
 
     # end the duration
     end = time_util.get_time_now()
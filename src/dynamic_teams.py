@@ -1,5 +1,6 @@
 # local imports
 import xmatters
+import integrator
 import config
 
 # python3 package imports
@@ -8,22 +9,54 @@ import json
 from logging.handlers import RotatingFileHandler
 
 
+# returns the list of a value that is either embedded as {"count": ..., "data": [...]} or a plain list
+def get_data(value):
+    if isinstance(value, dict):
+        return value.get("data", [])
+    return value or []
+
+
+# the operand, criteria, supervisor ids and observer names of a dynamic team request or of an existing team, regardless of order
+def get_signature(team):
+    criteria = team.get("criteria") or {}
+    return (
+        criteria.get("operand"),
+        sorted((criterion["criterionType"], criterion["field"], criterion["operand"], criterion["value"]) for criterion in get_data(criteria.get("criterion"))),
+        sorted(supervisor["id"] if isinstance(supervisor, dict) else supervisor for supervisor in get_data(team.get("supervisors"))),
+        sorted(observer["name"] for observer in get_data(team.get("observers")))
+    )
+
+
 # main process
 def main() -> object:
 
-    dynamic_teams_data = dynamic_teams_file.get_rows(["targetName", "supervisors", "observers", "operand"], {"targetName"}, True, ";")
+    # read the file once, grouping the criteria on the dynamic team name
+    dynamic_teams_data = dynamic_teams_file.get_groups("targetName", ["targetName", "supervisors", "observers", "operand"],
+                                                       ["criterionType", "field", "criterionOperand", "value"],
+                                                       {"supervisors", "observers"})
     log.info("dynamic_teams_data: "+json.dumps(dynamic_teams_data))
 
-    # retrieve the criteria
-    for data in dynamic_teams_data:
-        log.info("Collecting the criteria:  " + data["targetName"])
+    # when upserting every existing dynamic team is retrieved once, paged in parallel, to compare with the file
+    existing_teams = {}
+    if config.dynamic_teams['upsert']:
+        teams_search = integrator.xMattersPagedSearch(lambda url_filter: environment.get("/api/xm/1/dynamic-teams?embed=supervisors,observers,criteria" + url_filter),
+                                                      controller.get_thread_count(config.dynamic_teams['thread_count']))
+        for url_filter, team in teams_search.search([""], config.dynamic_teams['page_size']):
+            existing_teams[team["targetName"]] = team
+
+        if len(teams_search.errors) > 0:
+            log.error("Failed to retrieve the existing dynamic teams, no teams will be created or updated: " + str(teams_search.errors))
+            return "Dynamic Teams Not Retrieved"
+        log.info("Retrieved existing dynamic teams: " + str(len(existing_teams)))
 
-        dynamic_teams_criteria = dynamic_teams_file.get_rows(["criterionType", "field", "criterionOperand", "value"], {"targetName": data["targetName"]}, False)
-        log.info("dynamic_teams_criteria: " + json.dumps(dynamic_teams_criteria))
+    # the supervisors repeat across teams, every one not cached yet is requested once in a single batch
+    identity_cache.resolve_names(set(supervisor for target_name in dynamic_teams_data for supervisor in dynamic_teams_data[target_name]["parent"]["supervisors"]))
 
-        # ensure supervisors is a list type
-        if type(data["supervisors"]) is str:
-            data["supervisors"] = [data["supervisors"]]
+    create_requests = []
+    update_requests = []
+    for target_name in dynamic_teams_data:
+        data = dynamic_teams_data[target_name]["parent"]
+        dynamic_teams_criteria = dynamic_teams_data[target_name]["rows"]
 
         # build the request payload
         request = {
@@ -32,7 +65,7 @@ def main() -> object:
                 "operand": data["operand"],
                 "criterion": []
             },
-            "supervisors": xm_person.get_people_ids(data["supervisors"]),
+            "supervisors": identity_cache.get_ids(data["supervisors"]),
             "observers": []
         }
 
@@ -45,16 +78,26 @@ def main() -> object:
                 "value": criteria["value"],
             })
 
-        # ensure observers is a list type
-        if type(data["observers"]) is str:
-            data["observers"] = [data["observers"]]
-
         # add the observers
         for observer in data['observers']:
             request['observers'].append({"name": observer})
 
-        # execute the creation
-        # xm_dynamic_teams.create_dynamic_team(request)
+        # a team that already exists is updated, posting its id, only if its criteria, supervisors or observers differ from the file
+        existing_team = existing_teams.get(data["targetName"])
+        if not existing_team:
+            create_requests.append({"data": request})
+        elif get_signature(existing_team) != get_signature(request):
+            request["id"] = existing_team["id"]
+            update_requests.append({"data": request})
+
+    log.info("Dynamic teams to create: " + str(len(create_requests)) + ", to update: " + str(len(update_requests)) +
+             ", unchanged: " + str(len(dynamic_teams_data) - len(create_requests) - len(update_requests)))
+
+    # execute the creations and updates concurrently
+    if len(create_requests) + len(update_requests) > 0:
+        team_response = xm_collection.create_collection(xm_dynamic_teams.create_dynamic_team, create_requests + update_requests, controller.get_thread_count(config.dynamic_teams['thread_count']))
+        log.info("Dynamic team response: " + str(team_response["response"]))
+        log.info("Dynamic team errors: " + str(team_response["errors"]))
 
 # entry point when file initiated
 if __name__ == "__main__":
@@ -71,13 +114,23 @@ if __name__ == "__main__":
     log.info("Starting Process: " + time_util.format_date_time_now(start))
 
     # instantiate classes
-    environment = xmatters.xMattersAPI(config.environment["url"], config.environment["username"], config.environment["password"])
+    controller = integrator.ConcurrencyController(config.concurrency["initial"], config.concurrency["minimum"], config.concurrency["maximum"],
+                                                  config.concurrency["target_latency"], config.concurrency["adaptive"])
+    transport = integrator.Transport(config.transport["pool_size"], config.transport["gzip"], controller)
+    environment = integrator.xMattersTransportAPI(config.environment["url"], config.environment["username"], config.environment["password"], transport)
     xm_dynamic_teams = xmatters.xMattersDynamicTeams(environment)
+    xm_collection = xmatters.xMattersCollection(environment)
     xm_person = xmatters.xMattersPerson(environment)
-    dynamic_teams_file = xmatters.Column(config.dynamic_teams['file']["file_name"], config.dynamic_teams['file']["encoding"])
+    dynamic_teams_file = integrator.ColumnGroup(config.dynamic_teams['file']["file_name"], config.dynamic_teams['file']["encoding"])
+    identity_cache = integrator.IdentityCache(xm_person, controller.get_thread_count(config.dynamic_teams['thread_count']), config.identity_cache['file_name'],
+                                              config.identity_cache['ttl'], config.identity_cache['max_size'])
 
     # execute the main process
     main()
+    identity_cache.save()
+    log.info('Supervisor lookups served from cache: ' + str(identity_cache.hits) + ', requested: ' + str(identity_cache.misses))
+
+    transport.close()  # logs the connection reuse and the concurrency limits
 
     # end the duration
     end = time_util.get_time_now()
@@ -1,5 +1,6 @@
 # local imports
 import xmatters
+import integrator
 import config
 
 # python3 package imports
@@ -23,214 +24,74 @@ def main() -> object:
 
     try:
         # Get all ACTIVE people
-        people = []
-
-        param_data = {
-            "url_filter": '?status=ACTIVE'
-        }
+        url_filter = '?status=ACTIVE'
 
         print("Getting users")
-        # get initial page of people
-        people_search = xm_person.get_people(
-            param_data['url_filter'] + '&offset=0&limit=' + str(config.dynamic_team_custom_fields['page_size']))
-
-        # if nothing is returned let's skip this search loop
-        if not people_search:
-            log.info('No users found from the instance for search: ' + str(param_data['url_filter']))
-            return "No Users Found"
-
-        # if the total returned from the search is greater than the config page size, then we have more searching to do
-        if people_search['total'] > config.dynamic_team_custom_fields['page_size']:
-
-            people_collection = xm_collection.get_collection(xm_person.get_people, people_search['total'],
-                                                             config.dynamic_team_custom_fields['page_size'], param_data,
-                                                             config.dynamic_team_custom_fields['thread_count'])
-
-            # log and then concat two arrays
-            log.info("Retrieved " + str(len(people_collection['response'])) + " people from search: " + str(
-                param_data['url_filter']))
-            people = people_collection['response'] + people
-        else:
-            # else, continue on with that initial request and concat the two arrays
-            log.info(
-                "Retrieved " + str(len(people_search['data'])) + " people from search: " + str(param_data['url_filter']))
-            people = people_search['data'] + people
+        # the local snapshot is only downloaded again once it is stale
+        people_store.refresh([url_filter], config.dynamic_team_custom_fields['page_size'])
 
-        log.debug('Retrieved people data: ' + json.dumps(people))
-        log.info('Retrieved people count: ' + str(len(people)))
-        print('Retrieved people count: ' + str(len(people)))
+        if len(people_search.errors) > 0:
+            log.error("Failed pages for search: " + str(people_search.errors))
 
         #####################################
-        # End of getting people
-        #
         # Start of processing dynamic teams
         #####################################
 
-        # get a distinct list of dynamic teams
-        # dynamic_teams_data = dynamic_teams_file.get_rows(["targetName", "operand"], {"targetName", "operand"}, True, ";")
-        dynamic_teams_data = dynamic_teams_file.get_rows(["targetName", "operand"], {"targetName"}, True, ";")
+        # read the dynamic teams file once and group the criteria by dynamic team, keeping the file order
+        dynamic_teams_data = []
+        for target_name, group in dynamic_teams_file.get_groups("targetName", ["targetName", "operand"], ["field", "value"]).items():
+            dynamic_teams_data.append({"targetName": target_name, "operand": group["parent"]["operand"], "criteria": group["rows"]})
         log.debug("dynamic_teams_data: " + json.dumps(dynamic_teams_data))
 
+        # compile the criteria into a property -> value -> team index, teams with an AND operand take precedence over
+        # teams with an OR operand and within an operand the first team in the file wins
+        criteria_index = integrator.CriteriaIndex(dynamic_teams_data)
+        log.info("Indexed " + str(len(criteria_index)) + " dynamic teams")
+
         # get region field property name
         dt_region_field = config.dynamic_team_custom_fields["properties"]["dt_region_field"]
 
         update_data = []
-        added_people = []
-        dt_cnt = 0
-
-        # #####################################
-        #
-        # Process criteria that have an AND operand
-        #
-        # #####################################
-
-        for data in dynamic_teams_data:
-            dt_cnt = 0
-            if data["operand"] == 'AND':
-                log.info("processing Dynamic Team :  " + data["targetName"])
-                print("Processing Dynamic Team :  " + data["targetName"])
-
-                # get criteria for dynamic team
-                dynamic_teams_criteria = dynamic_teams_file.get_rows(["field", "value"],{"targetName": data["targetName"]},False)
-                dt_length = len(dynamic_teams_criteria)
-                log.debug("dynamic_teams_criteria_length: " + str(dt_length))
-
-                # iterate through each user and check if they match thge criteria
-                for person in people:
-                    log.debug("Processing " + person["targetName"])
-                    # log.debug("JSON: " + json.dumps(person))
-
-                    add_data = False
-                    do_add = False
-                    user_criteria_match = 0
-
-                    if "properties" not in person:
-                        log.debug(person["targetName"] + ' has no properties')
-                        break
-
-                    for row in dynamic_teams_criteria:
-                        key = row["field"]
-                        val = row["value"]
-
-                        if key not in person["properties"]:
-                            log.debug(person["targetName"] + " has no " + key + " property")
-                            break
-
-                        if person["properties"][key] == val:
-                            user_criteria_match = user_criteria_match+1
-                            log.debug(person["targetName"] + " " + person["properties"][key] + " = " + val)
-                            add_data = True
-
-                            if user_criteria_match < dt_length:
-                                continue
-
-                        else:
-                            add_data = False
-                            log.debug(person["targetName"] + " " + person["properties"][key] + " NOT " + val)
-                            break
-
-                        if add_data:
-                            added_people.append(person["targetName"])
-
-                            log.debug("Adding user " + person["targetName"] + " to " + data["targetName"])
-                            if dt_region_field in person['properties']:
-                                if person['properties'][dt_region_field] != data["targetName"]:
-                                    do_add = True
-                            else:
-                                do_add = True
-
-                        if do_add:
-                            dt_cnt += 1
-                            update_data.append({
-                                "data": {
-                                    "id": person["id"],
-                                    "targetName": person["targetName"],
-                                    "properties": {
-                                        dt_region_field: data["targetName"]
-                                    }
-                                }
-                            })
-                            log.debug("Removing " + person["targetName"] + " from People array")
-                            break
-
-                log.info("Number of users to update: " + str(dt_cnt))
-                print("Number of users to update: " + str(dt_cnt))
-
-        log.debug('Added People: ' + str(added_people))
-
+        dt_counts = {}
+        people_count = 0
+
+        # a single pass over people assigns each person their dynamic team
+        for person in people_store.get_people(url_filter):
+            people_count = people_count + 1
+            log.debug("Processing " + person["targetName"])
+
+            if "properties" not in person:
+                log.debug(person["targetName"] + ' has no properties')
+                continue
+
+            dt_name = criteria_index.match(person["properties"])
+            if not dt_name:
+                continue
+
+            log.debug("Adding user " + person["targetName"] + " to " + dt_name)
+            if person['properties'].get(dt_region_field) != dt_name:
+                dt_counts[dt_name] = dt_counts.get(dt_name, 0) + 1
+                update_data.append({
+                    "data": {
+                        "id": person["id"],
+                        "targetName": person["targetName"],
+                        "properties": {
+                            dt_region_field: dt_name
+                        }
+                    }
+                })
+
+        # if nothing is returned there is nothing to process
+        if people_count == 0:
+            log.info('No users found from the instance for search: ' + url_filter)
+            return "No Users Found"
 
-        # #####################################
-        #
-        # Process criteria that have an OR operand
-        #
-        # #####################################
+        log.info('Retrieved people count: ' + str(people_count))
+        print('Retrieved people count: ' + str(people_count))
 
         for data in dynamic_teams_data:
-            dt_cnt = 0
-
-            if data["operand"] == 'OR':
-                log.info("processing Dynamic Team :  " + data["targetName"])
-                print("Processing Dynamic Team :  " + data["targetName"])
-
-                # get criteria for dynamic team
-                dynamic_teams_criteria = dynamic_teams_file.get_rows(["field", "value"],
-                                                                     {"targetName": data["targetName"]}, False)
-                dt_length = len(dynamic_teams_criteria)
-                log.debug("dynamic_teams_criteria_length: " + str(dt_length))
-
-                # iterate through each user and check if they match thge criteria
-                for person in people:
-                    log.debug("Processing " + person["targetName"])
-                    # log.debug("JSON: " + json.dumps(person))
-
-                    add_data = False
-                    do_add = False
-
-                    if "properties" not in person:
-                        log.debug(person["targetName"] + ' has no properties')
-                        break
-
-                    for row in dynamic_teams_criteria:
-                        key = row["field"]
-                        val = row["value"]
-
-                        if key not in person["properties"]:
-                            # log.debug(person["targetName"] + " has no " + key + " property")
-                            continue
-
-                        if person["properties"][key] == val:
-                            log.debug(person["targetName"] + " " + person["properties"][key] + " = " + val)
-                            add_data = True
-
-                        else:
-                            add_data = False
-                            # log.debug(person["targetName"] + " " + person["properties"][key] + " NOT " + val)
-                            continue
-
-                        if add_data:
-                            log.debug("Adding user " + person["targetName"] + " to " + data["targetName"])
-                            if dt_region_field in person['properties']:
-                                if person['properties'][dt_region_field] != data["targetName"]:
-                                    do_add = True
-                            else:
-                                do_add = True
-
-                        if do_add:
-                            if person["targetName"] not in added_people:
-                                dt_cnt += 1
-                                update_data.append({
-                                    "data": {
-                                        "id": person["id"],
-                                        "targetName": person["targetName"],
-                                        "properties": {
-                                            dt_region_field: data["targetName"]
-                                        }
-                                    }
-                                })
-
-                                break
-                log.info("Number of users to update: " + str(dt_cnt))
-                print("Number of users to update: " + str(dt_cnt))
+            log.info("Dynamic Team :  " + data["targetName"] + " number of users to update: " + str(dt_counts.get(data["targetName"], 0)))
+            print("Dynamic Team :  " + data["targetName"] + " number of users to update: " + str(dt_counts.get(data["targetName"], 0)))
 
         log.info("Update Data has " + str(len(update_data)) + " users to update")
         print("Update Data has " + str(len(update_data)) + " users to update")
@@ -266,13 +127,22 @@ if __name__ == "__main__":
     print("Starting Process: " + time_util.format_date_time_now(start))
 
     # instantiate classes
-    environment = xmatters.xMattersAPI(config.environment["url"], config.environment["username"], config.environment["password"])
+    controller = integrator.ConcurrencyController(config.concurrency["initial"], config.concurrency["minimum"], config.concurrency["maximum"],
+                                                  config.concurrency["target_latency"], config.concurrency["adaptive"])
+    transport = integrator.Transport(config.transport["pool_size"], config.transport["gzip"], controller)
+    environment = integrator.xMattersTransportAPI(config.environment["url"], config.environment["username"], config.environment["password"], transport)
     xm_person = xmatters.xMattersPerson(environment)
     xm_collection = xmatters.xMattersCollection(environment)
-    dynamic_teams_file = xmatters.Column(config.dynamic_team_custom_fields['file']["dt_region_file_name"], config.dynamic_team_custom_fields['file']["encoding"])
+    people_search = integrator.xMattersPeopleSearch(xm_person, controller.get_thread_count(config.dynamic_team_custom_fields['thread_count']), config.dynamic_team_custom_fields['max_pages'])
+    people_store = integrator.PeopleStore(config.people_store['file_name'], people_search, config.people_store['ttl'],
+                                          config.people_store['probe'], controller.get_thread_count(config.dynamic_team_custom_fields['thread_count']))
+    dynamic_teams_file = integrator.ColumnGroup(config.dynamic_team_custom_fields['file']["dt_region_file_name"], config.dynamic_team_custom_fields['file']["encoding"])
 
     # execute the main process
     main()
+    people_store.close()
+
+    transport.close()  # logs the connection reuse and the concurrency limits
 
     # end the duration
     end = time_util.get_time_now()
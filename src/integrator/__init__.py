@@ -0,0 +1,16 @@
+from .paged_search import *
+from .people_search import *
+from .people_index import *
+from .people_store import *
+from .criteria_index import *
+from .column_group import *
+from .sinks import *
+from .ordered_pool import *
+from .identity_cache import *
+from .report_checkpoint import *
+from .role_reconciler import *
+from .role_state import *
+from .task_graph import *
+from .concurrency_controller import *
+from .transport import *
+from .async_collection import *
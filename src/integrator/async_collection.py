@@ -0,0 +1,141 @@
+# standard python modules
+import logging
+import asyncio
+import functools
+import inspect
+import itertools
+import concurrent.futures
+
+
+class xMattersAsyncCollection(object):
+    """
+    asyncio counterpart of xMattersCollection, every request of a collection is scheduled from a single event loop
+    with a semaphore bounding the requests in flight rather than splitting the requests into one bucket per thread.
+    The methods executed are matched to the request data as in xMattersCollection, they can be coroutine functions,
+    which are awaited, or regular functions such as the pyxmatters methods. Regular functions are still executed on
+    threads, one per request in flight, from a single thread pool sized to the concurrency and shared by every call,
+    so the requests in flight of all calls together never exceed the concurrency.
+    Results are available as async iterators, get_pages and create, or collected with get_collection and
+    create_collection. No results are kept on the instance so it can be shared between threads, each call runs its
+    own event loop. close shuts the thread pool down.
+
+    concurrency [Integer] (Required): maximum number of requests in flight of every call together, should not exceed
+        the pool_size of the transport
+    max_pending [Integer] (Optional): maximum number of requests started or waiting to be consumed at any time,
+        defaults to twice the concurrency
+    """
+
+    # constructor
+    def __init__(self, concurrency, max_pending=None):
+        self.__log = logging.getLogger(__name__)
+        self.__concurrency = concurrency
+        self.__max_pending = max(max_pending or concurrency * 2, concurrency)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+
+    """
+    child_method [Function] (Required): method returning a page, i.e. xMattersEvent.get_user_deliveries
+    total [Integer] (Required): total number of records of the collection
+    page_size [Integer] (Required): number of records per page
+    param_data [Dict] (Required): arguments of the method, the url_filter is extended with the offset and limit of
+        each page, i.e. {"url_filter": "at=2020-04-15T00:00:00Z", "event_id": "..."}
+
+    Async iterator of {"request_body": url_filter, "response_body": page} as pages arrive, not in offset order,
+    response_body is None if the page failed
+    """
+
+    async def get_pages(self, child_method, total, page_size, param_data):
+        params = self.__get_params(child_method, param_data)
+        requests = []
+        for offset in range(0, total, page_size):
+            page_params = dict(params, url_filter=params['url_filter'] + "&offset=" + str(offset) + "&limit=" + str(page_size))
+            requests.append((page_params['url_filter'], page_params))
+
+        async for result in self.__execute_all(child_method, requests):
+            yield result
+
+    """
+    child_method [Function] (Required): method executed for each item, i.e. xMattersPerson.create_person
+    data [Array] (Required): arguments of each request, i.e. [{"data": {...}}, {"data": {...}}], may be any iterable
+
+    Async iterator of {"request_body": item, "response_body": response} as requests complete, response_body is None
+    if the request failed
+    """
+
+    async def create(self, child_method, data):
+        async for result in self.__execute_all(child_method, ((item, self.__get_params(child_method, item)) for item in data)):
+            yield result
+
+    # returns {"response": [records of every page], "errors": [url_filter of every failed page]}, see get_pages
+    def get_collection(self, child_method, total, page_size, param_data):
+        async def collect():
+            response_data = []
+            errors = []
+            async for result in self.get_pages(child_method, total, page_size, param_data):
+                if result["response_body"]:
+                    response_data.extend(result["response_body"]["data"])
+                else:
+                    errors.append(result["request_body"])
+            return {"response": response_data, "errors": errors}
+
+        return asyncio.run(collect())
+
+    # returns {"response": [{"request_body": ..., "response_body": ...}], "errors": [failed items]}, see create
+    def create_collection(self, child_method, data):
+        async def collect():
+            response = []
+            errors = []
+            async for result in self.create(child_method, data):
+                if result["response_body"]:
+                    response.append(result)
+                else:
+                    errors.append(result["request_body"])
+            return {"response": response, "errors": errors}
+
+        return asyncio.run(collect())
+
+    def close(self):
+        self.__executor.shutdown(wait=True)
+
+    # the arguments of the item matching the parameters of the method, as xMattersCollection
+    @staticmethod
+    def __get_params(method, item):
+        params = {}
+        for param in inspect.signature(method).parameters:
+            if param in item:
+                params[param] = item[param]
+        return params
+
+    async def __execute_all(self, method, requests):
+        def_name = "__execute_all "
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.__concurrency)
+        executor = None if inspect.iscoroutinefunction(method) else self.__executor
+
+        async def execute(request_body, params):
+            async with semaphore:
+                try:
+                    if executor:
+                        response = await loop.run_in_executor(executor, functools.partial(method, **params))
+                    else:
+                        response = await method(**params)
+                except Exception as e:
+                    self.__log.error(def_name + "Request: " + str(request_body) + " failed with exception: " + str(e))
+                    response = None
+            return {"request_body": request_body, "response_body": response}
+
+        requests = iter(requests)
+        pending = set()
+        try:
+            while True:
+                for request_body, params in itertools.islice(requests, self.__max_pending - len(pending)):
+                    pending.add(asyncio.ensure_future(execute(request_body, params)))
+
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,63 @@
+# standard python modules
+import logging
+import csv
+
+
+class ColumnGroup(object):
+    """
+    ColumnGroup reads a file once with csv.DictReader(f, delimiter=",") and groups the rows on a parent column,
+    it replaces the pattern of Column.get_rows(..., distinct=True) followed by one Column.get_rows(..., {key: value})
+    per parent, which reads the whole file again for every parent.
+    As with Column, column headers MUST be unique otherwise the last duplicate column header will overwrite
+    previous entries
+    """
+
+    # constructor
+    def __init__(self, file, encoding):
+        self.__log = logging.getLogger(__name__)
+        self.__file = file
+        self.__encoding = encoding
+
+    """
+    key [String] (Required): parent column the rows are grouped on, i.e. "targetName"
+
+    parent_columns [Array] (Required): columns taken from the first occurrence of each key, i.e.
+        ["targetName", "supervisors", "observers"]
+
+    child_columns [Array] (Required): columns taken from every row of each key, i.e. ["shift", "member"]
+
+    list_columns [Set] (Optional): parent columns always returned as a list split on the delimiter, i.e. if
+        {"supervisors"} provided: ldavid;jseinfeld --> ['ldavid', 'jseinfeld'], jseinfeld --> ['jseinfeld'], "" --> []
+
+    delimiter [String] (Optional): delimiter used to split the list_columns, defaults to ";"
+
+    Returns a dict keyed on the key value in file order, i.e.
+        {"West Village": {"parent": {"name": "West Village", ...}, "rows": [{"shift": "Default Shift", ...}]}}
+    Columns that don't exist in the file are not returned
+    """
+
+    def get_groups(self, key, parent_columns, child_columns, list_columns=None, delimiter=";"):
+        list_columns = list_columns or set()
+        groups = {}
+
+        with open(self.__file, encoding=self.__encoding) as f:
+            reader = csv.DictReader(f, delimiter=",")
+            headers = reader.fieldnames or []
+            parent_columns = [column for column in parent_columns if column in headers]
+            child_columns = [column for column in child_columns if column in headers]
+
+            for row in reader:
+                group = groups.get(row[key])
+                if group is None:
+                    parent = {}
+                    for column in parent_columns:
+                        if column in list_columns:
+                            parent[column] = [value for value in row[column].split(delimiter) if value != ""]
+                        else:
+                            parent[column] = row[column]
+                    group = groups[row[key]] = {"parent": parent, "rows": []}
+
+                group["rows"].append(dict((column, row[column]) for column in child_columns))
+
+        self.__log.debug("Grouped " + self.__file + " on " + key + " into " + str(len(groups)) + " groups")
+        return groups
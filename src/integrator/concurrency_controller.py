@@ -0,0 +1,125 @@
+# standard python modules
+import logging
+import threading
+import time
+import email.utils
+
+
+class ConcurrencyController(object):
+    """
+    Adapts the number of requests in flight to how the instance responds, additive increase multiplicative decrease.
+    Every response faster than the target_latency raises the limit by one request per limit responses, a 429, a 5xx
+    or a failed request halves it, at most once for the requests sent at the same limit, and a Retry-After header
+    holds every request back until it passed. Changes of the limit are logged, get_stats returns the limits reached.
+    The pools of the scripts are sized to the maximum with get_thread_count and the controller, through Transport,
+    decides how many of their requests are in flight. When not adaptive the configured thread counts are used as is
+    and requests are never held back.
+
+    initial [Integer] (Required): requests in flight at the start
+    minimum [Integer] (Required): lowest limit the controller backs off to
+    maximum [Integer] (Required): highest limit the controller raises to, the size of every pool
+    target_latency [Float] (Required): seconds, slower responses don't raise the limit
+    adaptive [Boolean] (Optional): adapt the limit, defaults to True
+    """
+
+    # constructor
+    def __init__(self, initial, minimum, maximum, target_latency, adaptive=True):
+        self.__log = logging.getLogger(__name__)
+        self.__minimum = minimum
+        self.__maximum = maximum
+        self.__target_latency = target_latency
+        self.__adaptive = adaptive
+        self.__condition = threading.Condition()
+        self.__limit = float(min(max(initial, minimum), maximum))
+        self.__in_flight = 0
+        self.__paused_until = 0
+        self.__decreased_at = 0
+        self.__stats = {"lowest": int(self.__limit), "highest": int(self.__limit), "throttled": 0, "failed": 0}
+
+    @property
+    def limit(self):
+        return int(self.__limit)
+
+    # the size of a pool, the maximum when adaptive otherwise the configured thread_count
+    def get_thread_count(self, thread_count):
+        return self.__maximum if self.__adaptive else thread_count
+
+    # waits for a request to be allowed in flight, returns the time it was allowed at
+    def acquire(self):
+        if not self.__adaptive:
+            return time.time()
+
+        with self.__condition:
+            while True:
+                paused = self.__paused_until - time.time()
+                if paused > 0:
+                    self.__condition.wait(paused)
+                elif self.__in_flight >= int(self.__limit):
+                    self.__condition.wait()
+                else:
+                    break
+
+            self.__in_flight = self.__in_flight + 1
+            return time.time()
+
+    """
+    started [Float] (Required): time returned by acquire
+    status_code [Integer] (Optional): status code of the response, None if the request failed without a response
+    retry_after [String] (Optional): Retry-After header of the response, in seconds or as an http date
+    """
+
+    def release(self, started, status_code, retry_after=None):
+        if not self.__adaptive:
+            return
+
+        with self.__condition:
+            self.__in_flight = self.__in_flight - 1
+            now = time.time()
+            previous = int(self.__limit)
+
+            if status_code is None or status_code == 429 or status_code >= 500:
+                if status_code == 429:
+                    self.__stats["throttled"] = self.__stats["throttled"] + 1
+                else:
+                    self.__stats["failed"] = self.__stats["failed"] + 1
+
+                wait = get_retry_after(retry_after)
+                if wait and now + wait > self.__paused_until:
+                    self.__paused_until = now + wait
+                    self.__log.info("Holding requests for " + str(wait) + " seconds as requested by Retry-After")
+
+                # requests sent before the last decrease were sent at the higher limit and don't decrease it again
+                if started >= self.__decreased_at:
+                    self.__limit = max(float(self.__minimum), self.__limit / 2)
+                    self.__decreased_at = now
+            elif now - started <= self.__target_latency:
+                self.__limit = min(float(self.__maximum), self.__limit + 1 / self.__limit)
+
+            if int(self.__limit) != previous:
+                self.__stats["lowest"] = min(self.__stats["lowest"], int(self.__limit))
+                self.__stats["highest"] = max(self.__stats["highest"], int(self.__limit))
+                self.__log.info("Concurrency limit " + ("lowered" if int(self.__limit) < previous else "raised") +
+                                " to " + str(int(self.__limit)) + " after status code: " + str(status_code))
+
+            self.__condition.notify_all()
+
+    # returns {"limit": ..., "lowest": ..., "highest": ..., "throttled": ..., "failed": ...}
+    def get_stats(self):
+        with self.__condition:
+            return dict(self.__stats, limit=int(self.__limit))
+
+
+# returns the seconds of a Retry-After header, given in seconds or as an http date, None if there is none
+def get_retry_after(retry_after):
+    if not retry_after:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,66 @@
+# standard python modules
+import logging
+
+
+class CriteriaIndex(object):
+    """
+    Compiles the criteria of dynamic teams into a property -> value -> teams index so a person can be matched against
+    every team with a single lookup per property instead of evaluating every team against every person.
+
+    A person matches an AND team when every field/value pair of the team matches, and an OR team when any of them
+    matches. AND teams take precedence over OR teams, within an operand the first team in the order provided wins.
+
+    teams [Array] (Required): list of dict objects in order of precedence, i.e.
+        [{"targetName": "Dynamic Teams 1", "operand": "OR", "criteria": [{"field": "City", "value": "Brooklyn"}]}]
+    """
+
+    # constructor
+    def __init__(self, teams):
+        self.__log = logging.getLogger(__name__)
+        self.__index = {}
+        self.__teams = []
+
+        for team in teams:
+            pairs = set((criterion["field"], criterion["value"]) for criterion in team["criteria"])
+            if team["operand"] not in ("AND", "OR") or len(pairs) == 0:
+                self.__log.debug("Skipping dynamic team without usable criteria: " + team["targetName"])
+                continue
+
+            position = len(self.__teams)
+            self.__teams.append((team["targetName"], team["operand"], len(pairs)))
+            for field, value in pairs:
+                self.__index.setdefault(field, {}).setdefault(value, []).append(position)
+
+        self.__log.debug("Indexed " + str(len(self.__teams)) + " dynamic teams across " + str(len(self.__index)) +
+                         " fields")
+
+    # returns the targetName of the team the properties belong to, or None if no team matches
+    def match(self, properties):
+        hits = {}
+        for field, value in properties.items():
+            values = self.__index.get(field)
+
+            # criteria values are read from a file, so only text properties can match
+            if values is None or type(value) is not str:
+                continue
+
+            for position in values.get(value, ()):
+                hits[position] = hits.get(position, 0) + 1
+
+        first_and = None
+        first_or = None
+        for position, count in hits.items():
+            target_name, operand, required = self.__teams[position]
+            if operand == "AND" and count == required and (first_and is None or position < first_and):
+                first_and = position
+            elif operand == "OR" and (first_or is None or position < first_or):
+                first_or = position
+
+        if first_and is not None:
+            return self.__teams[first_and][0]
+        if first_or is not None:
+            return self.__teams[first_or][0]
+        return None
+
+    def __len__(self):
+        return len(self.__teams)
@@ -0,0 +1,222 @@
+# standard python modules
+import logging
+import threading
+import collections
+import concurrent.futures
+import json
+import os
+import time
+
+
+class IdentityCache(object):
+    """
+    Memo of person id <-> targetName lookups so the same person is only requested once no matter how many rows
+    reference them. Unknown ids or targetNames can be resolved in a single deduplicated batch with resolve and
+    resolve_names, which request them in parallel, a person requested by either is cached in both directions.
+    When a file_name is provided the cache is kept between runs, entries older than the ttl are requested again and
+    the least recently used entries are evicted once the cache holds more than max_size people.
+    hits counts the lookups answered from the cache and misses counts the lookups that required a request.
+    The cache is safe to share between threads, a person already being requested by one thread is waited for by the
+    others rather than requested again, so each person is requested at most once per run.
+
+    xm_person [xMattersPerson] (Required): person class used to request unknown people
+    thread_count [Integer] (Required): number of people requested in parallel by resolve and resolve_names
+    file_name [String] (Optional): path of the json file the cache is loaded from and saved to
+    ttl [Integer] (Optional): seconds an entry is used for before it is requested again, defaults to no expiry
+    max_size [Integer] (Optional): maximum number of people kept, defaults to no limit
+    """
+
+    # constructor
+    def __init__(self, xm_person, thread_count, file_name=None, ttl=None, max_size=None):
+        self.__log = logging.getLogger(__name__)
+        self.__xm_person = xm_person
+        self.__thread_count = thread_count
+        self.__file_name = file_name
+        self.__ttl = ttl
+        self.__max_size = max_size
+        self.__lock = threading.Lock()
+        self.__entries = collections.OrderedDict()  # id: [targetName, cached at], least recently used first
+        self.__ids = {}  # targetName: id
+        self.__failed = set()
+        self.__in_flight = {}  # key: Future of the request of the key
+        self.hits = 0
+        self.misses = 0
+
+        if self.__file_name:
+            self.__load()
+
+    # returns the targetName of the person id, requesting it if unknown, or None if the person can't be retrieved
+    def get_target_name(self, person_id):
+        with self.__lock:
+            if self.__is_known(person_id, person_id):
+                self.hits = self.hits + 1
+                return self.__entries[person_id][0] if person_id in self.__entries else None
+            claim = self.__claim(person_id)
+
+        person = self.__get_person(claim)
+        return person["targetName"] if person else None
+
+    # returns the id of the targetName, requesting it if unknown, or None if the person can't be retrieved
+    def get_id(self, target_name):
+        with self.__lock:
+            if self.__is_known(self.__ids.get(target_name), target_name):
+                self.hits = self.hits + 1
+                return self.__ids.get(target_name)
+            claim = self.__claim(target_name)
+
+        person = self.__get_person(claim)
+        return person["id"] if person else None
+
+    # returns the ids of the targetNames that could be retrieved, in order, as xMattersPerson.get_people_ids
+    def get_ids(self, target_names):
+        ids = []
+        for target_name in target_names:
+            person_id = self.get_id(target_name)
+            if person_id:
+                ids.append(person_id)
+
+        return ids
+
+    # requests every unknown id of the list in parallel, returns once every one of them is known
+    def resolve(self, person_ids):
+        with self.__lock:
+            claims = [self.__claim(person_id) for person_id in set(person_ids)
+                      if not self.__is_known(person_id, person_id)]
+
+        self.__request_all(claims)
+
+    # requests every unknown targetName of the list in parallel, returns once every one of them is known
+    def resolve_names(self, target_names):
+        with self.__lock:
+            claims = [self.__claim(target_name) for target_name in set(target_names)
+                      if not self.__is_known(self.__ids.get(target_name), target_name)]
+
+        self.__request_all(claims)
+
+    def add(self, person_id, target_name):
+        with self.__lock:
+            self.__put(person_id, target_name, time.time())
+
+    # written to a temporary file first so a failure while saving never leaves a partial cache behind, failures are only logged
+    def save(self):
+        if not self.__file_name:
+            return
+
+        with self.__lock:
+            entries = list(self.__entries.items())
+
+        try:
+            temp_file_name = self.__file_name + ".tmp"
+            with open(temp_file_name, 'w') as f:
+                json.dump(entries, f)
+            os.replace(temp_file_name, self.__file_name)
+            self.__log.debug("Saved " + str(len(entries)) + " people to " + self.__file_name)
+        except Exception as e:
+            self.__log.error("Unable to save cache file name: " + str(self.__file_name) + " with exception: " + str(e))
+
+    # True if the key is cached and still fresh, or already failed this run, refreshes the use of the entry
+    def __is_known(self, person_id, key):
+        if key in self.__failed:
+            return True
+
+        entry = self.__entries.get(person_id)
+        if entry is None:
+            return False
+
+        if self.__ttl is not None and time.time() - entry[1] > self.__ttl:
+            self.__remove(person_id)
+            return False
+
+        self.__entries.move_to_end(person_id)
+        return True
+
+    def __put(self, person_id, target_name, at):
+        if person_id in self.__entries and self.__entries[person_id][0] != target_name:
+            self.__ids.pop(self.__entries[person_id][0], None)
+
+        self.__entries[person_id] = [target_name, at]
+        self.__entries.move_to_end(person_id)
+        self.__ids[target_name] = person_id
+
+        while self.__max_size is not None and len(self.__entries) > self.__max_size:
+            self.__remove(next(iter(self.__entries)))
+
+    def __remove(self, person_id):
+        target_name = self.__entries.pop(person_id)[0]
+        if self.__ids.get(target_name) == person_id:
+            del self.__ids[target_name]
+
+    # returns (key, future, owner), owner is True if the caller has to request the key, otherwise the key is already
+    # being requested by another thread and the caller waits for its future, called with the lock held
+    def __claim(self, key):
+        if key in self.__in_flight:
+            return key, self.__in_flight[key], False
+
+        future = concurrent.futures.Future()
+        self.__in_flight[key] = future
+        return key, future, True
+
+    # requests the key if claimed by the caller, otherwise waits for the request of the other thread
+    def __get_person(self, claim):
+        key, future, owner = claim
+        if owner:
+            return self.__request(key, future)
+
+        person = future.result()
+        with self.__lock:
+            self.hits = self.hits + 1
+        return person
+
+    def __request_all(self, claims):
+        def_name = "__request_all "
+        if len(claims) == 0:
+            return
+
+        owned = [(key, future) for key, future, owner in claims if owner]
+        self.__log.debug(def_name + "Resolving " + str(len(owned)) + " unknown people, waiting for " +
+                         str(len(claims) - len(owned)) + " requested by other threads")
+        if len(owned) > 0:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.__thread_count) as executor:
+                for key, future in owned:
+                    executor.submit(self.__request, key, future)
+
+        concurrent.futures.wait([future for key, future, owner in claims])
+
+    # key is either the id or the targetName, both are accepted by get_person, the future of the key is always
+    # completed, with None if the person can't be retrieved, so threads waiting for it never hang
+    def __request(self, key, future):
+        def_name = "__request "
+        person = None
+        try:
+            person = self.__xm_person.get_person(key)
+        except Exception as e:
+            self.__log.error(def_name + "Exception while retrieving person: " + key + " with exception: " + str(e))
+
+        with self.__lock:
+            self.misses = self.misses + 1
+            del self.__in_flight[key]
+            if not person:
+                self.__log.error(def_name + "Failed to retrieve person: " + key)
+                self.__failed.add(key)
+            else:
+                self.__put(person["id"], person["targetName"], time.time())
+
+        future.set_result(person)
+        return person
+
+    def __load(self):
+        try:
+            with open(self.__file_name) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self.__log.error("Unable to read cache file name: " + str(self.__file_name) + " with exception: " + str(e))
+            return
+
+        now = time.time()
+        for person_id, (target_name, at) in entries:
+            if self.__ttl is None or now - at <= self.__ttl:
+                self.__put(person_id, target_name, at)
+
+        self.__log.debug("Loaded " + str(len(self.__entries)) + " people from " + self.__file_name)
@@ -0,0 +1,40 @@
+# standard python modules
+import logging
+import itertools
+import collections
+import concurrent.futures
+
+
+class OrderedPool(object):
+    """
+    Executes a function for many items on a bounded pool of threads and hands the results back in the order of the
+    items, so the caller can start working on the first results while later ones are still being retrieved and
+    the output stays deterministic.
+
+    thread_count [Integer] (Required): number of items processed in parallel
+    max_pending [Integer] (Optional): maximum number of items submitted or waiting to be consumed at any time,
+        defaults to twice the thread_count
+    """
+
+    # constructor
+    def __init__(self, thread_count, max_pending=None):
+        self.__log = logging.getLogger(__name__)
+        self.__thread_count = thread_count
+        self.__max_pending = max(max_pending or thread_count * 2, thread_count)
+
+    # yields a tuple of each item and the result of function(item), in the order of the items
+    def map(self, function, items):
+        items = iter(items)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.__thread_count) as executor:
+            pending = collections.deque()
+            for item in itertools.islice(items, self.__max_pending):
+                pending.append((item, executor.submit(function, item)))
+
+            while pending:
+                item, future = pending.popleft()
+
+                # keep the pool busy while the caller works through this result
+                for next_item in itertools.islice(items, 1):
+                    pending.append((next_item, executor.submit(function, next_item)))
+
+                yield item, future.result()
@@ -0,0 +1,106 @@
+# standard python modules
+import logging
+import collections
+import concurrent.futures
+
+
+class xMattersPagedSearch(object):
+    """
+    Streams the results of paged searches page by page instead of waiting for the full result list.
+    The first page of a search is requested on its own to learn the total, it is then yielded as is and the
+    remaining pages of that search are queued. Every page of every search shares a single pool of threads so the
+    number of requests in flight never exceeds the thread_count, no matter how many searches are executed.
+
+    method [Function] (Required): method executing a single page of the search, called with the url_filter followed
+        by '&offset=<offset>&limit=<limit>' and returning the response body with total and data, i.e.
+        xMattersPerson.get_people or xMattersEvent.get_events
+    thread_count [Integer] (Required): number of requests executed in parallel, see config.collection
+    max_pages [Integer] (Optional): maximum number of pages requested or waiting to be consumed at any time,
+        this caps the number of pages held in memory, and the requests in flight, even when the thread_count is
+        larger, i.e. sized to the maximum of config.concurrency. Defaults to twice the thread_count
+    """
+
+    # constructor
+    def __init__(self, method, thread_count, max_pages=None):
+        self.__log = logging.getLogger(__name__)
+        self.__method = method
+        self.__max_pages = max_pages or thread_count * 2
+        self.__thread_count = min(thread_count, self.__max_pages)  # more threads than pages would never be used
+        self.total = 0
+        self.totals = {}
+        self.errors = []
+
+    """
+    url_filters [Array] (Required): search filters without paging, i.e. ['?site=Site%201', '?site=Site%202']
+    page_size [Integer] (Required): number of records requested per page
+
+    Yields a tuple of the url_filter and the list of records contained in each page as pages arrive, pages are not
+    guaranteed to be returned in search or offset order. The total for each search is kept in totals.
+    """
+
+    def get_search_pages(self, url_filters, page_size):
+        def_name = "get_search_pages "
+        del self.errors[:]  # first clear the list from any previous searches
+        self.totals.clear()
+        self.total = 0
+
+        # the first page of every search is queued up front, remaining pages are queued once the total is known
+        tasks = collections.deque((url_filter, 0) for url_filter in url_filters)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.__thread_count) as executor:
+            pending = {}
+            while tasks or pending:
+                while tasks and len(pending) < self.__max_pages:
+                    url_filter, offset = tasks.popleft()
+                    pending[self.__submit(executor, url_filter, offset, page_size)] = (url_filter, offset)
+
+                done, not_done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    url_filter, offset = pending.pop(future)
+                    response = future.result()
+
+                    if not response:
+                        self.__log.error(def_name + "Failed to retrieve page at offset: " + str(offset) +
+                                         " for search: " + url_filter)
+                        self.errors.append(url_filter + '&offset=' + str(offset) + '&limit=' + str(page_size))
+                        continue
+
+                    if offset == 0:
+                        self.totals[url_filter] = response['total']
+                        self.total = self.total + response['total']
+                        self.__log.debug(def_name + "Search: " + url_filter + " has total: " + str(response['total']))
+
+                        # finish searches already started before moving on to the first page of the next search
+                        tasks.extendleft((url_filter, next_offset) for next_offset in
+                                         reversed(range(page_size, response['total'], page_size)))
+
+                    # the initial page is reused rather than requested again
+                    yield url_filter, response['data']
+
+    # yields the list of records contained in each page of a single search, see get_search_pages
+    def get_pages(self, url_filter, page_size):
+        for url_filter, page in self.get_search_pages([url_filter], page_size):
+            yield page
+
+    # yields a tuple of the url_filter and each record of the searches, see get_search_pages
+    def search(self, url_filters, page_size):
+        for url_filter, page in self.get_search_pages(url_filters, page_size):
+            for record in page:
+                yield url_filter, record
+
+    # yields each record of a single search, see get_search_pages
+    def get_records(self, url_filter, page_size):
+        for page in self.get_pages(url_filter, page_size):
+            for record in page:
+                yield record
+
+    # requests a single record to learn the total of a search, returns None if the request failed
+    def get_total(self, url_filter):
+        response = self.__method(url_filter + '&offset=0&limit=1')
+        if not response:
+            return None
+        return response['total']
+
+    def __submit(self, executor, url_filter, offset, page_size):
+        return executor.submit(self.__method,
+                               url_filter + '&offset=' + str(offset) + '&limit=' + str(page_size))
@@ -0,0 +1,48 @@
+# standard python modules
+import logging
+
+
+class PeopleIndex(object):
+    """
+    Accumulates people records keyed on their id so a person returned by more than one search is only stored,
+    and therefore only updated, once. The number of duplicates collapsed is kept in duplicates.
+    """
+
+    # constructor
+    def __init__(self):
+        self.__log = logging.getLogger(__name__)
+        self.__people = {}
+        self.duplicates = 0
+
+    # returns True if the person was added, False if the person was already in the index
+    def add(self, person):
+        if person["id"] in self.__people:
+            self.duplicates = self.duplicates + 1
+            self.__log.debug("Duplicate person collapsed: " + str(person.get("targetName", person["id"])))
+            return False
+
+        self.__people[person["id"]] = person
+        return True
+
+    # returns the number of people added from the iterable
+    def add_all(self, people):
+        added = 0
+        for person in people:
+            if self.add(person):
+                added = added + 1
+        return added
+
+    def get(self, person_id):
+        return self.__people.get(person_id)
+
+    def values(self):
+        return self.__people.values()
+
+    def __contains__(self, person_id):
+        return person_id in self.__people
+
+    def __iter__(self):
+        return iter(self.__people.values())
+
+    def __len__(self):
+        return len(self.__people)
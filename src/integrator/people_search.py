@@ -0,0 +1,22 @@
+# local module
+from .paged_search import xMattersPagedSearch
+
+
+class xMattersPeopleSearch(xMattersPagedSearch):
+    """
+    Streams the results of people searches page by page, see xMattersPagedSearch
+
+    xm_person [xMattersPerson] (Required): person class used to execute the search
+    thread_count [Integer] (Required): number of requests executed in parallel, see config.collection
+    max_pages [Integer] (Optional): maximum number of pages requested or waiting to be consumed at any time,
+        this caps the number of pages held in memory, and the requests in flight, even when the thread_count is
+        larger. Defaults to twice the thread_count
+    """
+
+    # constructor
+    def __init__(self, xm_person, thread_count, max_pages=None):
+        super(xMattersPeopleSearch, self).__init__(xm_person.get_people, thread_count, max_pages)
+
+    # yields each person record of a single search, see get_search_pages
+    def get_people(self, url_filter, page_size):
+        return self.get_records(url_filter, page_size)
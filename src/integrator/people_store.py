@@ -0,0 +1,195 @@
+# standard python modules
+import logging
+import sqlite3
+import json
+import hashlib
+import time
+import concurrent.futures
+
+
+class PeopleStore(object):
+    """
+    Keeps a local SQLite snapshot of the people returned by each search so scheduled runs only download people
+    again once a snapshot is stale. When probe is enabled a single record request of each search decides, the
+    snapshot is stale as soon as the total differs from the total it holds, the ttl is only a safety net for changes
+    the probe can't see, as it only detects people joining or leaving a search. Without probe every snapshot older
+    than the ttl is stale. Searches embedding devices are always stale, device changes don't change the person
+    records and can't be probed. Stale snapshots are refreshed through the people search and only the records that
+    changed are rewritten.
+
+    Snapshots are keyed on the search url_filter, i.e. '?status=ACTIVE&embed=devices', and people are indexed by
+    id, targetName and custom property value.
+
+    file_name [String] (Required): path of the SQLite database, created if it doesn't exist
+    people_search [xMattersPeopleSearch] (Required): search used to refresh the snapshots
+    ttl [Integer] (Required): number of seconds a snapshot is trusted, 0 refreshes the snapshot on every run, when
+        probing it should be several runs long, otherwise clearly below the interval the script is scheduled at
+    probe [Boolean] (Optional): request the total of each search to detect changes before the ttl expires
+    thread_count [Integer] (Optional): number of probes executed in parallel
+    """
+
+    # constructor
+    def __init__(self, file_name, people_search, ttl, probe=True, thread_count=5):
+        self.__log = logging.getLogger(__name__)
+        self.__people_search = people_search
+        self.__ttl = ttl
+        self.__probe = probe
+        self.__thread_count = thread_count
+        self.__connection = sqlite3.connect(file_name)
+        self.__create_tables()
+
+    # returns the url_filters whose snapshot is missing, expired, embeds devices or, if probing, whose total has changed
+    def get_stale(self, url_filters):
+        def_name = "get_stale "
+        now = time.time()
+        stale = []
+        probes = []
+
+        for url_filter in url_filters:
+            snapshot = self.__connection.execute("SELECT total, synced_at FROM snapshots WHERE url_filter = ?",
+                                                 (url_filter,)).fetchone()
+            if not snapshot or now - snapshot[1] >= self.__ttl or 'embed=devices' in url_filter:
+                stale.append(url_filter)
+            elif self.__probe:
+                probes.append((url_filter, snapshot[0]))
+
+        if len(probes) > 0:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.__thread_count) as executor:
+                totals = executor.map(self.__people_search.get_total, [probe[0] for probe in probes])
+                for (url_filter, total), probed_total in zip(probes, totals):
+                    if probed_total != total:
+                        self.__log.debug(def_name + "Search: " + url_filter + " total changed from " + str(total) +
+                                         " to " + str(probed_total))
+                        stale.append(url_filter)
+
+        self.__log.debug(def_name + "Stale searches: " + str(stale))
+        return stale
+
+    """
+    url_filters [Array] (Required): search filters without paging to bring up to date
+    page_size [Integer] (Required): number of people requested per page
+
+    Returns the list of url_filters that were refreshed from xMatters.
+    """
+
+    def refresh(self, url_filters, page_size):
+        def_name = "refresh "
+        stale = self.get_stale(url_filters)
+        if len(stale) == 0:
+            return stale
+
+        # load the checksum of every stored record so unchanged people are not rewritten
+        checksums = {}
+        for url_filter in stale:
+            checksums[url_filter] = dict(self.__connection.execute(
+                "SELECT id, checksum FROM people WHERE url_filter = ?", (url_filter,)))
+
+        sync_time = time.time()
+        seen = dict((url_filter, set()) for url_filter in stale)
+        changed = 0
+        for url_filter, person in self.__people_search.search(stale, page_size):
+            seen[url_filter].add(person["id"])
+            checksum = self.__checksum(person)
+            if checksums[url_filter].get(person["id"]) != checksum:
+                self.__write_person(url_filter, person, checksum, sync_time)
+                changed = changed + 1
+                if changed % page_size == 0:
+                    self.__connection.commit()
+
+        for url_filter in stale:
+            failed = [error for error in self.__people_search.errors if error.startswith(url_filter + '&offset=')]
+            if len(failed) > 0:
+                # a failed page would otherwise remove the people it contained, the snapshot is retried next run
+                self.__log.error(def_name + "Search: " + url_filter + " not fully refreshed, failed pages: " +
+                                 str(failed))
+                continue
+
+            removed = [(url_filter, person_id) for person_id in checksums[url_filter]
+                       if person_id not in seen[url_filter]]
+            self.__connection.executemany("DELETE FROM people WHERE url_filter = ? AND id = ?", removed)
+            self.__connection.executemany("DELETE FROM properties WHERE url_filter = ? AND id = ?", removed)
+            self.__connection.execute("INSERT OR REPLACE INTO snapshots (url_filter, total, synced_at) VALUES (?, ?, ?)",
+                                      (url_filter, self.__people_search.totals.get(url_filter, 0), sync_time))
+            self.__log.info(def_name + "Search: " + url_filter + " refreshed with " + str(len(seen[url_filter])) +
+                            " people, removed: " + str(len(removed)))
+
+        self.__connection.commit()
+        self.__log.info(def_name + "Refreshed " + str(len(stale)) + " searches, changed people: " + str(changed))
+        return stale
+
+    # yields every person record of a snapshot
+    def get_people(self, url_filter):
+        for row in self.__connection.execute("SELECT record FROM people WHERE url_filter = ?", (url_filter,)):
+            yield json.loads(row[0])
+
+    def get_person(self, person_id):
+        row = self.__connection.execute("SELECT record FROM people WHERE id = ? ORDER BY updated_at DESC LIMIT 1",
+                                        (person_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_person_by_target_name(self, target_name):
+        row = self.__connection.execute(
+            "SELECT record FROM people WHERE target_name = ? ORDER BY updated_at DESC LIMIT 1",
+            (target_name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # yields the people with a custom property value, optionally limited to a single snapshot
+    def find_by_property(self, name, value, url_filter=None):
+        query = "SELECT p.record FROM properties pr JOIN people p ON p.url_filter = pr.url_filter AND p.id = pr.id " \
+                "WHERE pr.name = ? AND pr.value = ?"
+        params = [name, self.__to_text(value)]
+        if url_filter is not None:
+            query = query + " AND pr.url_filter = ?"
+            params.append(url_filter)
+
+        for row in self.__connection.execute(query, params):
+            yield json.loads(row[0])
+
+    # merges a successful update into every stored record of the person so the next run doesn't repeat it
+    def update_person(self, data):
+        rows = self.__connection.execute("SELECT url_filter, record FROM people WHERE id = ?", (data["id"],)).fetchall()
+        for url_filter, record in rows:
+            person = json.loads(record)
+            for key in data:
+                if key == "properties" and "properties" in person:
+                    person["properties"].update(data["properties"])
+                else:
+                    person[key] = data[key]
+            self.__write_person(url_filter, person, self.__checksum(person), time.time())
+        self.__connection.commit()
+
+    def close(self):
+        self.__connection.close()
+
+    def __write_person(self, url_filter, person, checksum, updated_at):
+        self.__connection.execute("INSERT OR REPLACE INTO people (url_filter, id, target_name, checksum, record, "
+                                  "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                                  (url_filter, person["id"], person.get("targetName"), checksum, json.dumps(person),
+                                   updated_at))
+        self.__connection.execute("DELETE FROM properties WHERE url_filter = ? AND id = ?", (url_filter, person["id"]))
+
+        properties = []
+        for name, value in person.get("properties", {}).items():
+            values = value if type(value) is list else [value]
+            for item in values:
+                properties.append((url_filter, person["id"], name, self.__to_text(item)))
+        self.__connection.executemany("INSERT INTO properties (url_filter, id, name, value) VALUES (?, ?, ?, ?)",
+                                      properties)
+
+    def __checksum(self, person):
+        return hashlib.sha1(json.dumps(person, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def __to_text(self, value):
+        return value if type(value) is str else json.dumps(value)
+
+    def __create_tables(self):
+        self.__connection.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (url_filter TEXT PRIMARY KEY, total INTEGER, synced_at REAL);
+            CREATE TABLE IF NOT EXISTS people (url_filter TEXT, id TEXT, target_name TEXT, checksum TEXT,
+                                               record TEXT, updated_at REAL, PRIMARY KEY (url_filter, id));
+            CREATE INDEX IF NOT EXISTS people_id ON people (id);
+            CREATE INDEX IF NOT EXISTS people_target_name ON people (target_name);
+            CREATE TABLE IF NOT EXISTS properties (url_filter TEXT, id TEXT, name TEXT, value TEXT);
+            CREATE INDEX IF NOT EXISTS properties_name_value ON properties (name, value);
+            CREATE INDEX IF NOT EXISTS properties_person ON properties (url_filter, id);
+        """)
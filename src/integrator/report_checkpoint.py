@@ -0,0 +1,73 @@
+# standard python modules
+import logging
+import json
+import os
+
+
+class ReportCheckpoint(object):
+    """
+    Records which events and rows a report has already exported so a later run of the same day only exports what
+    is new or changed. Each event keeps whether it is complete, in which case it is not retrieved again and its row
+    signatures are dropped, otherwise a signature of every row exported for it.
+    The rows of an event are only recorded once set_event is called after they were written, so saving never
+    records rows that a failed output file dropped. unsaved counts the events recorded since the last save so the
+    checkpoint can be saved in batches.
+    A checkpoint of a different day, or one that can't be read, is discarded and the report starts over.
+
+    file_name [String] (Required): path of the json checkpoint file
+    date [String] (Required): day the report covers, i.e. '2020-04-15'
+    """
+
+    # constructor
+    def __init__(self, file_name, date):
+        self.__log = logging.getLogger(__name__)
+        self.__file_name = file_name
+        self.__date = date
+        self.__events = {}
+        self.__pending = {}  # event_id: {key: signature} of the rows not recorded yet
+        self.resumed = False
+        self.unsaved = 0
+
+        try:
+            with open(self.__file_name) as f:
+                checkpoint = json.load(f)
+            if checkpoint["date"] == self.__date:
+                self.__events = checkpoint["events"]
+                self.resumed = True
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.__log.error("Unable to read checkpoint file name: " + str(self.__file_name) + " with exception: " + str(e))
+
+        self.__log.debug("Checkpoint for " + self.__date + " resumed: " + str(self.resumed) + " with " +
+                         str(len(self.__events)) + " events")
+
+    def is_complete(self, event_id):
+        return event_id in self.__events and self.__events[event_id]["complete"]
+
+    # returns True if the row differs from the last row exported for the key, the row is recorded by set_event
+    def update_row(self, event_id, key, signature):
+        rows = self.__pending.setdefault(event_id, {})
+        if rows.get(key, self.__events.get(event_id, {}).get("rows", {}).get(key)) == signature:
+            return False
+
+        rows[key] = signature
+        return True
+
+    # records the rows of the event written since the last call, a complete event only keeps its state
+    def set_event(self, event_id, complete):
+        rows = self.__pending.pop(event_id, {})
+        if complete:
+            self.__events[event_id] = {"complete": True, "rows": {}}
+        else:
+            event = self.__events.setdefault(event_id, {"complete": False, "rows": {}})
+            event["rows"].update(rows)
+        self.unsaved = self.unsaved + 1
+
+    # written to a temporary file first so a failure while saving never leaves a partial checkpoint behind
+    def save(self):
+        temp_file_name = self.__file_name + ".tmp"
+        with open(temp_file_name, 'w') as f:
+            json.dump({"date": self.__date, "events": self.__events}, f)
+        os.replace(temp_file_name, self.__file_name)
+        self.unsaved = 0
@@ -0,0 +1,99 @@
+# standard python modules
+import logging
+
+
+class RoleDiff(object):
+    """
+    Result of RoleReconciler.reconcile, holds only the people whose roles have to change.
+    Each change is a dict of the targetName, id, the full list of roles to set and the sets of roles added and
+    removed, i.e. {"targetName": "mmcbride", "id": "...", "roles": ["Standard User", "Developer"],
+    "add": {"Developer"}, "remove": {"Full Access User"}}
+    """
+
+    # constructor
+    def __init__(self):
+        self.changes = []
+        self.added = 0
+        self.removed = 0
+
+    def append(self, change):
+        self.changes.append(change)
+        self.added = self.added + len(change["add"])
+        self.removed = self.removed + len(change["remove"])
+
+    # returns the changes as request data for xMattersPerson.modify_person
+    def get_requests(self):
+        return [{"data": {"targetName": change["targetName"], "id": change["id"], "roles": change["roles"]}}
+                for change in self.changes]
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+
+class RoleReconciler(object):
+    """
+    Works out the roles of each person from the membership of the mapped groups. An index of role -> users and of
+    user -> desired roles is built once from the rosters, so each person is reconciled in a single pass of set
+    differences instead of checking them against every role.
+    Only the roles of the mapping are managed, any other role of a person is kept as is. A person without any role
+    left, or without the default role, is given the default role.
+
+    group_roles [Array] (Required): roster of each mapped group and the roles its members receive, i.e.
+        [{"users": {"user_1", "user_2"}, "roles": ["Role_1", "Role_2"]}, {"users": {"user_4"}, "roles": ["Role_2"]}]
+    default_role [String] (Required): role every person is given, i.e. "Standard User"
+    """
+
+    # constructor
+    def __init__(self, group_roles, default_role):
+        self.__log = logging.getLogger(__name__)
+        self.__default_role = default_role
+        self.role_users = {}
+        self.user_roles = {}
+
+        for item in group_roles:
+            for role in item["roles"]:
+                self.role_users.setdefault(role, set()).update(item["users"])
+            for user in item["users"]:
+                self.user_roles.setdefault(user, set()).update(item["roles"])
+
+        self.__managed_roles = set(self.role_users)
+        self.__log.debug("Indexed " + str(len(self.role_users)) + " roles for " + str(len(self.user_roles)) + " users")
+
+    # every user that is a member of a mapped group
+    @property
+    def users(self):
+        return set(self.user_roles)
+
+    """
+    people [Array] (Required): xMatters person records with their roles embedded, i.e. from ?embed=roles
+
+    Returns a RoleDiff of the people whose roles have to change
+    """
+
+    def reconcile(self, people):
+        diff = RoleDiff()
+        for person in people:
+            current = [role["name"] for role in person["roles"]["data"]]
+            current_set = set(current)
+            desired = self.user_roles.get(person["targetName"], set())
+
+            add = desired.difference(current_set)
+            remove = current_set.intersection(self.__managed_roles).difference(desired)
+
+            # existing roles keep their order, new roles are added in a stable order
+            roles = [role for role in current if role not in remove] + sorted(add)
+            if self.__default_role not in roles:
+                if self.__default_role in remove:
+                    remove.discard(self.__default_role)
+                else:
+                    add.add(self.__default_role)
+                roles.append(self.__default_role)
+
+            if add or remove:
+                diff.append({"targetName": person["targetName"], "id": person["id"], "roles": roles,
+                             "add": add, "remove": remove})
+
+        return diff
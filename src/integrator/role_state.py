@@ -0,0 +1,111 @@
+# standard python modules
+import logging
+import hashlib
+import base64
+import json
+import os
+
+
+class RoleState(object):
+    """
+    Keeps what roles.py learned on its last run in a json file: the decoded role mapping keyed on the hash of the
+    library script it was decoded from, and a hash of the mapping, rosters and roles of the last run that completed
+    without errors. A run whose hash is unchanged would make no updates, so reconciliation can be skipped.
+    The snapshot of that run holds the members of each group and the people holding a role so the next run can
+    work out which members changed, see get_snapshot.
+    A state file that can't be read is discarded and the run starts from nothing.
+
+    file_name [String] (Required): path of the json state file
+    """
+
+    # constructor
+    def __init__(self, file_name):
+        self.__log = logging.getLogger(__name__)
+        self.__file_name = file_name
+        self.__state = {"mapping": None, "state_hash": None, "snapshot": None}
+
+        try:
+            with open(self.__file_name) as f:
+                self.__state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.__log.error("Unable to read state file name: " + str(self.__file_name) + " with exception: " + str(e))
+
+    """
+    script [String] (Optional): base64 encoded content of the role mapping library, None if it couldn't be retrieved
+
+    Returns the "data" of the role mapping, it is only decoded again when the script content changed. If the script
+    couldn't be retrieved the mapping of the last run is returned, None if there is no such mapping
+    """
+
+    def get_mapping(self, script):
+        def_name = "get_mapping "
+        mapping = self.__state["mapping"]
+
+        if script is None:
+            if mapping:
+                self.__log.warning(def_name + "Role mapping not retrieved, using the mapping cached with hash: " + mapping["hash"])
+                return mapping["data"]
+            return None
+
+        script_hash = hashlib.sha256(script.encode("utf-8")).hexdigest()
+        if mapping and mapping["hash"] == script_hash:
+            self.__log.debug(def_name + "Role mapping unchanged with hash: " + script_hash)
+            return mapping["data"]
+
+        self.__log.info(def_name + "Role mapping changed, new hash: " + script_hash)
+        data = json.loads(base64.b64decode(script))["data"]
+        self.__state["mapping"] = {"hash": script_hash, "data": data}
+        return data
+
+    # hash of everything reconciliation depends on, the order of groups, members and roles doesn't matter
+    @staticmethod
+    def get_state_hash(group_roles, rosters, people):
+        return hash_json({
+            "mapping": RoleState.get_mapping_hash(group_roles),
+            "rosters": dict((group, sorted(users)) for group, users in rosters.items()),
+            "people": dict((person["targetName"], sorted(role["name"] for role in person["roles"]["data"]))
+                           for person in people)
+        })
+
+    # hash of the group-roles mapping, the order of the groups doesn't matter
+    @staticmethod
+    def get_mapping_hash(group_roles):
+        return hash_json(sorted(json.dumps(item, sort_keys=True) for item in group_roles))
+
+    """
+    Returns the snapshot of the last run that completed without errors, None if there is none, i.e.
+        {"mapping_hash": "...", "rosters": {"Group 1": ["user_1", "user_2"]}, "holders": ["user_1", "user_3"],
+        "full_sweep_at": 1587000000.0}
+    holders are the people that held a mapped role after that run and full_sweep_at the time of the last full sweep
+    """
+
+    def get_snapshot(self):
+        return self.__state["snapshot"]
+
+    def set_snapshot(self, mapping_hash, rosters, holders, full_sweep_at):
+        self.__state["snapshot"] = {
+            "mapping_hash": mapping_hash,
+            "rosters": dict((group, sorted(users)) for group, users in rosters.items()),
+            "holders": sorted(holders),
+            "full_sweep_at": full_sweep_at
+        }
+
+    def is_unchanged(self, state_hash):
+        return self.__state["state_hash"] == state_hash
+
+    def set_state_hash(self, state_hash):
+        self.__state["state_hash"] = state_hash
+
+    # written to a temporary file first so a failure while saving never leaves a partial state behind
+    def save(self):
+        temp_file_name = self.__file_name + ".tmp"
+        with open(temp_file_name, 'w') as f:
+            json.dump(self.__state, f)
+        os.replace(temp_file_name, self.__file_name)
+
+
+# sha256 of the json of the object with sorted keys
+def hash_json(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
@@ -0,0 +1,250 @@
+# standard python modules
+import logging
+import csv
+import gzip
+import json
+import os
+import re
+import sqlite3
+
+
+# schema types and the sqlite column type each is stored as, dates are stored as iso formatted text
+SCHEMA_TYPES = {
+    "string": "TEXT",
+    "boolean": "INTEGER",
+    "integer": "INTEGER",
+    "float": "REAL",
+    "date": "TEXT",
+    "datetime": "TEXT"
+}
+
+
+class Sink(object):
+    """
+    Streams dict rows to an output file through a bounded buffer instead of collecting every row in memory before
+    writing. The file is only created when the first row arrives so an empty run leaves any previous file untouched.
+    A failure to open or write the file is logged once and further rows are dropped, any other sink is unaffected,
+    failed tells whether rows were dropped.
+    Subclasses implement _open, _write_rows and _close for their format, see get_sink.
+
+    file_name [String] (Required): path of the output file, overwritten on the first row unless appending
+    encoding [String] (Required): encoding of text output files
+    schema [Array] (Required): tuples of the column and its type written for each row, in order, i.e.
+        [("targetName", "string"), ("has_sms", "boolean")], types: string, boolean, integer, float, date, datetime
+    buffer_size [Integer] (Optional): number of rows held before they are written to the file
+    append [Boolean] (Optional): append to an existing file rather than overwriting it
+    """
+
+    # constructor
+    def __init__(self, file_name, encoding, schema, buffer_size=1000, append=False):
+        self._log = logging.getLogger(__name__)
+        self._file_name = file_name
+        self._encoding = encoding
+        self._schema = schema
+        self._append = append
+        self.__buffer_size = buffer_size
+        self.__buffer = []
+        self.__opened = False
+        self.__failed = False
+        self.count = 0
+
+        for column, column_type in schema:
+            if column_type not in SCHEMA_TYPES:
+                raise ValueError("Unknown type: " + str(column_type) + " for column: " + column)
+
+    @property
+    def failed(self):
+        return self.__failed
+
+    @property
+    def columns(self):
+        return [column for column, column_type in self._schema]
+
+    def write(self, row):
+        if self.__failed:
+            return
+
+        # a copy is buffered as the caller may change and write the same row again before it's flushed
+        self.__buffer.append(dict(row))
+        self.count = self.count + 1
+        if len(self.__buffer) >= self.__buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.__failed or len(self.__buffer) == 0:
+            return
+
+        try:
+            self.open()
+            self._write_rows(self.__buffer)
+        except Exception as e:
+            self._log.error('Exception while writing to file name: ' + str(self._file_name) +
+                            ' with exception: ' + str(e))
+            self.__failed = True
+
+        del self.__buffer[:]
+
+    # opens the file, and writes any header required, ahead of the first row
+    def open(self):
+        if self.__opened:
+            return
+
+        self._open(self._append and os.path.exists(self._file_name) and os.path.getsize(self._file_name) > 0)
+        self.__opened = True
+
+    def close(self):
+        self.flush()
+        if self.__opened:
+            self._close()
+            self.__opened = False
+
+    # returns the values of the row in schema order, converted to their type
+    def _get_values(self, row):
+        return [convert_value(row[column], column_type) for column, column_type in self._schema]
+
+    def _open(self, existing):
+        raise NotImplementedError()
+
+    def _write_rows(self, rows):
+        raise NotImplementedError()
+
+    def _close(self):
+        raise NotImplementedError()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvSink(Sink):
+    """
+    Writes QUOTE_ALL csv with a header row, compressed with gzip if compress is set. Appending to a gzip file adds a
+    new gzip member which readers decompress as a single file.
+    See Sink for the other parameters
+
+    compress [Boolean] (Optional): gzip the file
+    """
+
+    # constructor
+    def __init__(self, file_name, encoding, schema, buffer_size=1000, append=False, compress=False):
+        super(CsvSink, self).__init__(file_name, encoding, schema, buffer_size, append)
+        self.__compress = compress
+        self.__file = None
+        self.__writer = None
+
+    def _open(self, existing):
+        mode = 'a' if self._append else 'w'
+        if self.__compress:
+            self.__file = gzip.open(self._file_name, mode + 't', newline='', encoding=self._encoding)
+        else:
+            self.__file = open(self._file_name, mode, newline='', encoding=self._encoding)
+        self.__writer = csv.writer(self.__file, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+        if not existing:
+            self.__writer.writerow(self.columns)
+
+    # csv is text only, the values are written as they are rather than converted
+    def _write_rows(self, rows):
+        self.__writer.writerows([row[column] for column in self.columns] for row in rows)
+        self.__file.flush()
+
+    def _close(self):
+        self.__file.close()
+        self.__file = None
+
+
+class JsonLinesSink(Sink):
+    """
+    Writes one json object per line with each value converted to its schema type, so every line can be loaded on
+    its own. See Sink for the parameters
+    """
+
+    # constructor
+    def __init__(self, file_name, encoding, schema, buffer_size=1000, append=False):
+        super(JsonLinesSink, self).__init__(file_name, encoding, schema, buffer_size, append)
+        self.__file = None
+
+    def _open(self, existing):
+        self.__file = open(self._file_name, 'a' if self._append else 'w', encoding=self._encoding)
+
+    def _write_rows(self, rows):
+        for row in rows:
+            self.__file.write(json.dumps(dict(zip(self.columns, self._get_values(row))), ensure_ascii=False) + "\n")
+        self.__file.flush()
+
+    def _close(self):
+        self.__file.close()
+        self.__file = None
+
+
+class SqliteSink(Sink):
+    """
+    Inserts the rows into a table of a sqlite database with a column of the matching type for each column of the
+    schema, every buffer of rows is inserted with a single executemany and committed. The table is dropped and
+    created again unless appending. See Sink for the other parameters, encoding is not used
+
+    table [String] (Optional): name of the table, defaults to the file name without its extension
+    """
+
+    # constructor
+    def __init__(self, file_name, encoding, schema, buffer_size=1000, append=False, table=None):
+        super(SqliteSink, self).__init__(file_name, encoding, schema, buffer_size, append)
+        self.__table = table or re.sub(r'\W', '_', os.path.splitext(os.path.basename(file_name))[0])
+        self.__connection = None
+
+    def _open(self, existing):
+        self.__connection = sqlite3.connect(self._file_name)
+        if not self._append:
+            self.__connection.execute('DROP TABLE IF EXISTS "' + self.__table + '"')
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS "' + self.__table + '" (' +
+                                  ', '.join('"' + column + '" ' + SCHEMA_TYPES[column_type]
+                                            for column, column_type in self._schema) + ')')
+        self.__connection.commit()
+
+    def _write_rows(self, rows):
+        self.__connection.executemany('INSERT INTO "' + self.__table + '" VALUES (' +
+                                      ', '.join('?' for column in self._schema) + ')',
+                                      [self._get_values(row) for row in rows])
+        self.__connection.commit()
+
+    def _close(self):
+        self.__connection.close()
+        self.__connection = None
+
+
+# converts a value to the python type of the schema type, booleans also accept their text form
+def convert_value(value, column_type):
+    if value is None:
+        return None
+    if column_type == "boolean":
+        return value if isinstance(value, bool) else str(value).lower() in ("true", "1", "yes")
+    if column_type == "integer":
+        return int(value)
+    if column_type == "float":
+        return float(value)
+    return str(value)
+
+
+"""
+output_format [String] (Required): csv, csv_gzip, jsonl or sqlite
+file_name [String] (Required): path of the output file
+encoding [String] (Required): encoding of text output files
+schema [Array] (Required): tuples of the column and its type, see Sink
+buffer_size [Integer] (Optional): number of rows held before they are written to the file
+append [Boolean] (Optional): append to an existing file rather than overwriting it
+
+Returns the sink writing the format
+"""
+
+
+def get_sink(output_format, file_name, encoding, schema, buffer_size=1000, append=False):
+    if output_format == "csv":
+        return CsvSink(file_name, encoding, schema, buffer_size, append)
+    if output_format == "csv_gzip":
+        return CsvSink(file_name, encoding, schema, buffer_size, append, compress=True)
+    if output_format == "jsonl":
+        return JsonLinesSink(file_name, encoding, schema, buffer_size, append)
+    if output_format == "sqlite":
+        return SqliteSink(file_name, encoding, schema, buffer_size, append)
+    raise ValueError("Unknown output format: " + str(output_format))
@@ -0,0 +1,68 @@
+# standard python modules
+import logging
+import collections
+import concurrent.futures
+
+
+class TaskGraph(object):
+    """
+    Executes tasks that release further tasks once they complete, i.e. adding members to a group once the group is
+    created, on a single bounded pool of threads. The callback of a task receives its result and runs on the thread
+    calling run, so callbacks don't need any locking. Tasks added by a callback depend on the completed task and
+    are executed ahead of the tasks still queued, so work that was started is finished first.
+    A task raising an exception is logged and its callback receives None.
+
+    thread_count [Integer] (Required): number of tasks executed in parallel
+    max_pending [Integer] (Optional): maximum number of tasks submitted to the pool at any time, defaults to twice
+        the thread_count
+    """
+
+    # constructor
+    def __init__(self, thread_count, max_pending=None):
+        self.__log = logging.getLogger(__name__)
+        self.__thread_count = thread_count
+        self.__max_pending = max(max_pending or thread_count * 2, thread_count)
+        self.__tasks = collections.deque()
+        self.__dependents = None
+        self.count = 0
+
+    """
+    function [Function] (Required): function executed by the task
+    args [Tuple] (Optional): arguments the function is called with
+    callback [Function] (Optional): called with the result of the function once the task completes
+    """
+
+    def add(self, function, args=(), callback=None):
+        if self.__dependents is not None:
+            self.__dependents.append((function, args, callback))
+        else:
+            self.__tasks.append((function, args, callback))
+
+    # executes every task, and the tasks they release, returns once all of them completed
+    def run(self):
+        def_name = "run "
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.__thread_count) as executor:
+            pending = {}
+            while self.__tasks or pending:
+                while self.__tasks and len(pending) < self.__max_pending:
+                    function, args, callback = self.__tasks.popleft()
+                    pending[executor.submit(function, *args)] = callback
+
+                done, not_done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    callback = pending.pop(future)
+                    self.count = self.count + 1
+
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.__log.error(def_name + "Task failed with exception: " + str(e))
+                        result = None
+
+                    if callback:
+                        self.__dependents = []
+                        try:
+                            callback(result)
+                        finally:
+                            self.__tasks.extendleft(reversed(self.__dependents))
+                            self.__dependents = None
@@ -0,0 +1,119 @@
+# standard python modules
+import logging
+import json
+import threading
+
+# package imports
+import requests
+from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+import xmatters
+
+
+class Transport(object):
+    """
+    Shared HTTP transport for xMattersTransportAPI, a single requests.Session whose connection pool keeps the
+    connections of each host alive so the requests of every thread reuse them instead of opening a new connection,
+    and TLS handshake, per request. Responses are requested gzip compressed. The pool blocks, a request beyond the
+    pool_size waits for a connection to be free rather than opening a connection that is discarded afterwards.
+    get_stats returns, for each host, the requests sent and the connections opened to send them.
+    With a ConcurrencyController every request waits for the controller to allow it in flight and reports its
+    status code, latency and Retry-After header back to it.
+
+    pool_size [Integer] (Required): connections kept alive per host, should be at least the largest thread_count
+    gzip [Boolean] (Optional): request gzip compressed responses
+    controller [ConcurrencyController] (Optional): controller of the requests in flight
+    """
+
+    # constructor
+    def __init__(self, pool_size, gzip=True, controller=None):
+        self.__log = logging.getLogger(__name__)
+        self.__controller = controller
+        self.__lock = threading.Lock()
+        self.__session = requests.Session()
+        self.__adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.__session.mount("https://", self.__adapter)
+        self.__session.mount("http://", self.__adapter)
+        self.__session.headers.update({"Connection": "keep-alive"})
+        if gzip:
+            self.__session.headers.update({"Accept-Encoding": "gzip"})
+        self.__stats = {}
+
+    def get(self, url, **kwargs):
+        return self.__send(self.__session.get, url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.__send(self.__session.post, url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.__send(self.__session.put, url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.__send(self.__session.delete, url, **kwargs)
+
+    # a request without a response, i.e. a timeout or a reset connection, is reported as failed
+    def __send(self, method, url, **kwargs):
+        if not self.__controller:
+            return method(url, **kwargs)
+
+        started = self.__controller.acquire()
+        response = None
+        try:
+            response = method(url, **kwargs)
+        finally:
+            if response is None:
+                self.__controller.release(started, None)
+            else:
+                self.__controller.release(started, response.status_code, response.headers.get("Retry-After"))
+        return response
+
+    # returns {host: {"requests": ..., "connections": ...}}, including the pools of hosts no longer in use
+    def get_stats(self):
+        with self.__lock:
+            pools = self.__adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    self.__stats[pool.host] = {"requests": pool.num_requests, "connections": pool.num_connections}
+            return dict((host, dict(stats)) for host, stats in self.__stats.items())
+
+    def close(self):
+        self.__log.info("Connection reuse: " + json.dumps(self.get_stats()))
+        if self.__controller:
+            self.__log.info("Concurrency limits: " + json.dumps(self.__controller.get_stats()))
+        self.__session.close()
+
+
+class xMattersTransportAPI(xmatters.xMattersAPI):
+    """
+    xMattersAPI sending its requests through a shared Transport rather than opening a connection per request,
+    the retries and responses of xMattersAPI.execute are unchanged.
+
+    url [String] (Required): url of the xMatters instance, i.e. https://company.xmatters.com
+    username [String] (Required): username of the REST user
+    password [String] (Required): password of the REST user
+    transport [Transport] (Required): transport shared by every request
+    """
+
+    # constructor
+    def __init__(self, url, username, password, transport):
+        super(xMattersTransportAPI, self).__init__(url, username, password)
+        self.__url = url
+        self.__auth = HTTPBasicAuth(username, password)
+        self.__transport = transport
+
+    def post(self, data, path, headers=None):
+        return self.execute(self.__transport.post, self.__url + path, auth=self.__auth,
+                            headers={"Content-Type": "application/json"} if not headers else headers,
+                            data=json.dumps(data))
+
+    def put(self, data, path, headers=None):
+        return self.execute(self.__transport.put, self.__url + path, auth=self.__auth,
+                            headers={"Content-Type": "application/json"} if not headers else headers,
+                            data=json.dumps(data))
+
+    def get(self, path):
+        return self.execute(self.__transport.get, self.__url + path, auth=self.__auth)
+
+    def delete(self, path):
+        return self.execute(self.__transport.delete, self.__url + path, auth=self.__auth)
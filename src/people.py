@@ -1,5 +1,6 @@
 # local imports
 import xmatters
+import integrator
 import config
 
 # python3 package imports
@@ -26,47 +27,44 @@ def main() -> object:
         4. With payload update xMatters
     """
 
-    # captures the results of the search
-    people = []
+    # captures the results of the search keyed on the person id, a person matching several searches is stored once
+    people_index = integrator.PeopleIndex()
 
-    # first loop through the properties object for the property name
+    # build a search filter for every property name and value pair
+    url_filters = []
     for prop_name in config.people['properties']:
-
-        # next loop through the values associated to the individual property
         for prop_val in config.people['properties'][prop_name]:
-            # build param string
-            param_data = {
-                "url_filter": '?propertyName=' + urllib.parse.quote(prop_name, safe='') + '&propertyValue=' + urllib.parse.quote(prop_val, safe=''),
-            }
-
-            # get initial page
-            people_search = xm_person.get_people(param_data['url_filter'] + '&offset=0&limit=' + str(config.people['page_size']))
-
-            # if nothing is returned let's skip this search loop
-            if not people_search:
-                log.info('No users found from the instance for search: ' + str(param_data['url_filter']))
-                continue
-
-            # if the total returned from the the search is greater than the config page size, then we have more searching to do
-            if people_search['total'] > config.people['page_size']:
-                people_collection = xm_collection.get_collection(xm_person.get_people, people_search['total'],
-                                                                 config.people['page_size'], param_data,
-                                                                 config.people['thread_count'])
-
-                # log and then concat two arrays
-                log.info("Retrieved " + str(len(people_collection['response'])) + " people from search: " + str(param_data['url_filter']))
-                people = people_collection['response'] + people
-            else:
-                # else, continue on with that initial request and concat the two arrays
-                log.info("Retrieved " + str(len(people_search['data'])) + " people from search: " + str(param_data['url_filter']))
-                people = people_search['data'] + people
-
-    log.debug('Retrieved people data: ' + json.dumps(people))
-    log.info('Retrieved people count: ' + str(len(people)))
-
-    # now let's iterate through, build the payload, and make sure we're only updating users that are ACTIVE
+            url_filters.append('?propertyName=' + urllib.parse.quote(prop_name, safe='') + '&propertyValue=' + urllib.parse.quote(prop_val, safe=''))
+
+    # only the searches whose local snapshot is stale are downloaded again, every refreshed search shares the
+    # collection thread budget, so searches overlap while the requests in flight stay bounded
+    refreshed = people_store.refresh(url_filters, config.people['page_size'])
+    log.info('Refreshed ' + str(len(refreshed)) + ' of ' + str(len(url_filters)) + ' searches from the instance')
+    if len(people_search.errors) > 0:
+        log.error("Failed pages for search: " + str(people_search.errors))
+
+    # read the search results from the people store into the index
+    search_counts = dict.fromkeys(url_filters, 0)
+    for url_filter in url_filters:
+        for data in people_store.get_people(url_filter):
+            search_counts[url_filter] = search_counts[url_filter] + 1
+            log.debug('Retrieved person data: ' + json.dumps(data))
+            people_index.add(data)
+
+    for url_filter in url_filters:
+        if search_counts[url_filter] == 0:
+            log.info('No users found from the instance for search: ' + url_filter)
+        else:
+            log.info("Retrieved " + str(search_counts[url_filter]) + " people from search: " + url_filter)
+
+    people_count = sum(search_counts.values())
+
+    log.info('Retrieved people count: ' + str(people_count))
+    log.info('Unique people count: ' + str(len(people_index)) + ', duplicates collapsed: ' + str(people_index.duplicates))
+
+    # now let's iterate through, build the payload, making sure we're only updating users that are ACTIVE
     request_data = []
-    for data in people:
+    for data in people_index:
         try:
             if data['status'] == "ACTIVE":
                 request_data.append(dict(data=dict(targetName=data['targetName'],
@@ -79,10 +77,14 @@ def main() -> object:
 
     # only execute if there are requests
     if len(request_data) > 0:
-        person_response = xm_collection.create_collection(xm_person.modify_person, request_data, config.people['thread_count'])
+        person_response = xm_collection.create_collection(xm_person.modify_person, request_data, controller.get_thread_count(config.collection['thread_count']))
         log.info("Update response: " + str(person_response["response"]))
         log.info("Update errors: " + str(person_response["errors"]))
 
+        # keep the people store in line with the successful updates
+        for response in person_response["response"]:
+            people_store.update_person(response["request_body"]["data"])
+
 
 if __name__ == "__main__":
     # configure the logging
@@ -99,12 +101,21 @@ if __name__ == "__main__":
     log.info("Starting Process: " + time_util.format_date_time_now(start))
 
     # instantiate classes
-    environment = xmatters.xMattersAPI(config.environment["url"], config.environment["username"],
-                                       config.environment["password"])
+    controller = integrator.ConcurrencyController(config.concurrency["initial"], config.concurrency["minimum"], config.concurrency["maximum"],
+                                                  config.concurrency["target_latency"], config.concurrency["adaptive"])
+    transport = integrator.Transport(config.transport["pool_size"], config.transport["gzip"], controller)
+    environment = integrator.xMattersTransportAPI(config.environment["url"], config.environment["username"],
+                                                  config.environment["password"], transport)
     xm_person = xmatters.xMattersPerson(environment)
     xm_collection = xmatters.xMattersCollection(environment)
+    people_search = integrator.xMattersPeopleSearch(xm_person, controller.get_thread_count(config.collection['thread_count']), config.people['max_pages'])
+    people_store = integrator.PeopleStore(config.people_store['file_name'], people_search, config.people_store['ttl'],
+                                          config.people_store['probe'], controller.get_thread_count(config.collection['thread_count']))
 
     main()  # execute the main process
+    people_store.close()
+
+    transport.close()  # logs the connection reuse and the concurrency limits
 
     # end the duration
     end = time_util.get_time_now()
@@ -1,5 +1,6 @@
 # local imports
 import xmatters
+import integrator
 import config
 
 # python3 package imports
@@ -11,6 +12,54 @@ import urllib.parse
 import datetime
 import csv
 
+
+# retrieve every page of user deliveries for an event at a point in time, executed on the event pool, returns the user
+# deliveries and whether every page was retrieved, None if the event could not be retrieved at all
+def get_user_deliveries(event, at):
+
+    # get notification delivery details for each recipient
+    event_user_delivery = xm_event.get_user_deliveries(event['id'], 'at=' + at + '&offset=0&limit='+str(config.responses['page_size']))
+
+    if not event_user_delivery:
+        return None
+
+    # if above the page size limit execute the collection
+    if event_user_delivery['total'] > config.responses['page_size']:
+        param_data = {
+            "url_filter": 'at=' + at,
+            "event_id": event['id']
+        }
+
+        # the async collection keeps no results on the instance, so a single one is shared by every event
+        event_user_delivery_collection = async_collection.get_collection(xm_event.get_user_deliveries, event_user_delivery['total'], config.responses['page_size'], param_data)
+        if len(event_user_delivery_collection['errors']) > 0:
+            log.error('Failed pages of user deliveries: ' + str(event_user_delivery_collection['errors']))
+        event_user_delivery, retrieved = event_user_delivery_collection['response'], len(event_user_delivery_collection['errors']) == 0
+    else:  # otherwise continue on with that initial request
+        event_user_delivery, retrieved = event_user_delivery['data'], True
+
+    # temporary workaround implemented to resolve an issue where targetName isn't being provided
+    # the people without a targetName are resolved in a single parallel batch before the rows are built
+    identity_cache.resolve([data['person']['id'] for data in event_user_delivery if 'targetName' not in data['person']])
+
+    return event_user_delivery, retrieved
+
+
+# split the days from start_date to end_date, both included, into slices of a day or an hour
+def get_time_slices(start_date, end_date, slice_length):
+    step = datetime.timedelta(hours=1) if slice_length == "hour" else datetime.timedelta(days=1)
+    time_from = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.datetime.strptime(end_date, '%Y-%m-%d') + datetime.timedelta(days=1)
+
+    time_slices = []
+    while time_from < end:
+        time_to = min(time_from + step, end)
+        time_slices.append((time_from.strftime('%Y-%m-%dT%H:%M:%S.000Z'), time_to.strftime('%Y-%m-%dT%H:%M:%S.000Z')))
+        time_from = time_to
+
+    return time_slices
+
+
 # main process
 def main() -> object:
 
@@ -25,15 +74,74 @@ def main() -> object:
     # today_date = '2020-04-15'  # uncomment to override above to a past date stamp
     log.info(today_date)
 
-    events = xm_event.get_events('embed=targetedRecipients&propertyName=response_report&propertyValue=true&from=' + today_date +urllib.parse.quote('T00:00:00.000Z', safe=''))
+    # a backfill covers a date range split into time slices, otherwise the report covers today as a single slice
+    backfill = config.responses['backfill']
+    if backfill['enabled']:
+        log.info('Backfilling from ' + backfill['from'] + ' to ' + backfill['to'] + ' by ' + backfill['slice'])
+        time_slices = get_time_slices(backfill['from'], backfill['to'], backfill['slice'])
+    else:
+        time_slices = [(today_date + 'T00:00:00.000Z', None)]
+
+    url_filters = []
+    for time_from, time_to in time_slices:
+        url_filter = 'embed=targetedRecipients&propertyName=response_report&propertyValue=true&from=' + urllib.parse.quote(time_from, safe='')
+        if time_to:
+            url_filter = url_filter + '&to=' + urllib.parse.quote(time_to, safe='')
+        url_filters.append(url_filter)
+
+    # every page of every slice is retrieved on a single bounded pool, the events are merged on id as slices share
+    # their boundaries and then ordered on created so the report reads the same however the pages arrived
+    events_search = integrator.xMattersPagedSearch(xm_event.get_events, config.responses['event_thread_count'])
+    events = {}
+    for url_filter, event in events_search.search(url_filters, config.responses['page_size']):
+        events[event['id']] = event
+    events = sorted(events.values(), key=lambda event: event['created'])
+
+    if len(events_search.errors) > 0:
+        log.error('Failed to retrieve ' + str(len(events_search.errors)) + ' pages of events: ' + json.dumps(events_search.errors))
 
     log.debug('Received events ' + json.dumps(events))
 
-    log.info('Getting User Deliveries for ' + str(len(events['data'])) + ' events.')
+    log.info('Getting User Deliveries for ' + str(len(events)) + ' events.')
     current_date_time = datetime.datetime.utcnow()
 
-    csv_data = []
-    for event in events['data']:
+    # when incremental, the checkpoint records what was already exported today so this run only retrieves events that
+    # aren't complete yet and only appends the rows that are new or changed, the latest row of a key supersedes earlier ones
+    # a backfill always writes a complete report of its range
+    checkpoint = None
+    if config.responses['incremental'] and not backfill['enabled']:
+        checkpoint = integrator.ReportCheckpoint(config.responses['checkpoint_file_name'], today_date)
+        log.info('Resuming from checkpoint: ' + str(checkpoint.resumed))
+    append = checkpoint is not None and checkpoint.resumed
+
+    # rows are streamed to both files as each event's deliveries are processed, in the configured output format
+    csv_writer_new = integrator.get_sink(config.responses['output_format'], config.responses['file_name_new'], config.responses['encoding'],
+                                         [('key', 'string'), ('targetName', 'string'), ('response', 'string'), ('event_created', 'datetime'),
+                                          ('retrieved_date_time', 'datetime'), ('delivery_status', 'string'), ('workflow', 'string'), ('form', 'string'),
+                                          ('event_id', 'string'), ('recipientTargetName', 'string'), ('recipientTargetType', 'string')],
+                                         config.responses['buffer_size'], append)
+    csv_writer = integrator.get_sink(config.responses['output_format'], config.responses['file_name'], config.responses['encoding'],
+                                     [('key', 'string'), ('targetName', 'string'), ('response', 'string'), ('event_created', 'datetime'),
+                                      ('retrieved_date_time', 'datetime'), ('delivery_status', 'string')],
+                                     config.responses['buffer_size'], append)
+
+    # a new day of an incremental report starts both files over, even before its first row
+    if checkpoint and not checkpoint.resumed:
+        try:
+            csv_writer_new.open()
+            csv_writer.open()
+        except Exception as e:
+            log.error('Exception while opening output files with exception: ' + str(e))
+
+    event_data = events
+    if checkpoint:
+        event_data = [event for event in events if not checkpoint.is_complete(event['id'])]
+        log.info('Skipping ' + str(len(events) - len(event_data)) + ' events already complete in the checkpoint.')
+
+    # user deliveries are retrieved for several events at once, events are still processed in the order received
+    at = str(current_date_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    event_pool = integrator.OrderedPool(config.responses['event_thread_count'])
+    for event, result in event_pool.map(lambda event: get_user_deliveries(event, at), event_data):
 
         # collect details about each event
         event_details = {
@@ -64,25 +172,11 @@ def main() -> object:
         # event_details["recipientTargetName"] = recipientTargetName
         # event_details["recipientTargetType"] = recipientTargetType
 
-        # get notification delivery details for each recipient
-        event_user_delivery = xm_event.get_user_deliveries(event['id'], 'at=' + str(
-            current_date_time.strftime('%Y-%m-%dT%H:%M:%SZ')) + '&offset=0&limit='+str(config.responses['page_size']))
-
-        if not event_user_delivery:
+        if result is None:
             log.info('No log data found for event id ' + event['eventId'] + ' moving to next event id.')
             continue
 
-        # if above the page size limit execute the collection
-        if event_user_delivery['total'] > config.responses['page_size']:
-            param_data = {
-                "url_filter": 'at=' + str(current_date_time.strftime('%Y-%m-%dT%H:%M:%SZ')),
-                "event_id": event['id']
-            }
-            event_user_delivery_collection = xm_collection.get_collection(xm_event.get_user_deliveries, event_user_delivery['total'], config.responses['page_size'], param_data, config.responses['thread_count'])
-            event_user_delivery = event_user_delivery_collection['response']
-        else:  # otherwise continue on with that initial request
-            event_user_delivery = event_user_delivery['data']
-
+        event_user_delivery, retrieved = result
         log.debug('Event ID: ' + event['eventId'] + ', retrieved event_user_delivery data: ' + json.dumps(event_user_delivery))
         log.info('Event ID: ' + event['eventId'] + ', retrieved event_user_delivery number: ' + str(len(event_user_delivery)))
 
@@ -96,7 +190,9 @@ def main() -> object:
                     user_name = data['person']['targetName']
                 else:
                     log.debug('No targetName found for user id: ' + data['person']['id'] + ' attempting to get current targetName')
-                    user_name = (xm_person.get_person(data['person']['id']))['targetName']  # by design to throw an exception if fails
+                    user_name = identity_cache.get_target_name(data['person']['id'])
+                    if not user_name:
+                        raise Exception('targetName not found for user id: ' + data['person']['id'])  # by design to throw an exception if fails
                     log.debug('targetName received for ' + user_name)
 
 
@@ -118,77 +214,57 @@ def main() -> object:
                                     event_details["recipientTargetName"] = rec["recipient"]["targetName"]
                                     event_details['recipientTargetType'] = "GROUP"
 
-                # build array of objects to write to CSV file
-                if data['deliveryStatus'] == "RESPONDED":
-                    csv_data.append(dict(targetName=user_name,
-                                         response=data['response']['text'],
-                                         event_created=str(event['created'].replace('+0000', "")),
-                                         retrieved_date_time=str(current_date_time.isoformat()),
-                                         delivery_status=data['deliveryStatus'],
-                                         workflow=event_details['workflow_name'],
-                                         form=event_details['form_name'],
-                                         event_id=event_details['event_id'],
-                                         # event_uuid=event_details['event_uuid'],
-                                         recipientTargetName=str(event_details['recipientTargetName']),
-                                         recipientTargetType=str(event_details['recipientTargetType'])))
-                    counter = counter + 1
-                elif data['deliveryStatus'] == "DELIVERED":
-                    csv_data.append(dict(targetName=user_name,
-                                         response="",
-                                         event_created=str(event['created'].replace('+0000', "")),
-                                         retrieved_date_time=str(current_date_time.isoformat()),
-                                         delivery_status=data['deliveryStatus'],
-                                         workflow=event_details['workflow_name'],
-                                         form=event_details['form_name'],
-                                         event_id=event_details['event_id'],
-                                         # event_uuid=event_details['event_uuid'],
-                                         recipientTargetName=str(event_details['recipientTargetName']),
-                                         recipientTargetType=str(event_details['recipientTargetType'])))
+                # stream the row to both csv files, each row carries the uuid of its own event for the key
+                if data['deliveryStatus'] == "RESPONDED" or data['deliveryStatus'] == "DELIVERED":
+                    row = dict(targetName=user_name,
+                               response=data['response']['text'] if data['deliveryStatus'] == "RESPONDED" else "",
+                               event_created=str(event['created'].replace('+0000', "")),
+                               retrieved_date_time=str(current_date_time.isoformat()),
+                               delivery_status=data['deliveryStatus'],
+                               workflow=event_details['workflow_name'],
+                               form=event_details['form_name'],
+                               event_id=event_details['event_id'],
+                               recipientTargetName=str(event_details['recipientTargetName']),
+                               recipientTargetType=str(event_details['recipientTargetType']))
+
+                    # skip the rows already exported unchanged by a previous run
+                    if checkpoint and not checkpoint.update_row(event['id'], user_name, row['delivery_status'] + " " + row['response']):
+                        continue
+
+                    csv_writer_new.write(dict(row, key=row['targetName'] + " " + event_details['event_uuid']))
+                    csv_writer.write(dict(row, key=row['targetName'] + " " + row['event_created']))
                     counter = counter + 1
                 else:
-                    log.info('Not adding to csv writer array, unexpected information: ' + json.dumps(data))  # unlikely, but let's just log to make sure
+                    log.info('Not adding to csv writers, unexpected information: ' + json.dumps(data))  # unlikely, but let's just log to make sure
 
             except Exception as e:
                 log.error('Exception ' + str(e) + ' on line:  ' + str(data))
+                retrieved = False  # the event is retrieved again to export the row
 
-        log.info('Event ID ' + event['eventId'] + ' count of user delivery data added to csv writer array: ' + str(counter))
+        log.info('Event ID ' + event['eventId'] + ' count of user delivery data added to csv writers: ' + str(counter))
 
-    log.info('Found Number of Rows for User Delivery Data: ' + str(len(csv_data)))
+        # the rows are written before the checkpoint records them, an event that has terminated and whose pages were all retrieved
+        # won't be retrieved again, once a file failed no more events are recorded so the next run exports the dropped rows again,
+        # the checkpoint is saved in batches of events and once all events are processed
+        if checkpoint:
+            csv_writer_new.flush()
+            csv_writer.flush()
+            if csv_writer_new.failed or csv_writer.failed:
+                log.error('Output file failed, event id ' + event['eventId'] + ' is not recorded in the checkpoint')
+            else:
+                checkpoint.set_event(event['id'], retrieved and event.get('status') == "TERMINATED")
+                if checkpoint.unsaved >= config.responses['checkpoint_interval']:
+                    checkpoint.save()
 
-    if len(csv_data) > 0:
-        try:
-            with open(config.responses['file_name_new'], 'w', newline='', encoding=config.responses['encoding']) as csv_file_new:
-                csv_writer = csv.writer(csv_file_new, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+    # write any buffered rows
+    csv_writer_new.close()
+    csv_writer.close()
 
-                # write the header
-                csv_writer.writerow(['key', 'targetName', 'response', 'event_created', 'retrieved_date_time', 'delivery_status', 'workflow', 'form', 'event_id', 'recipientTargetName', 'recipientTargetType'])
+    if checkpoint and checkpoint.unsaved > 0:
+        checkpoint.save()
 
-                # write the values
-                for row in csv_data:
-                    primary_key = row['targetName']+" "+ event_details['event_uuid']
-                    csv_writer.writerow([primary_key, row['targetName'], row['response'], row['event_created'], row['retrieved_date_time'], row['delivery_status'], row['workflow'], row['form'], row['event_id'], row['recipientTargetName'], row['recipientTargetType']])
-
-        except Exception as e:
-            log.error('Exception while writing to csv file name: '+str(config.responses['file_name_new'])+' with exception: ' + str(e))
-
-        try:
-            with open(config.responses['file_name'], 'w', newline='',
-                      encoding=config.responses['encoding']) as csv_file:
-                csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
-
-                # write the header
-                csv_writer.writerow(
-                    ['key', 'targetName', 'response', 'event_created', 'retrieved_date_time', 'delivery_status'])
-
-                # write the values
-                for row in csv_data:
-                    primary_key = row['targetName'] + " " + row['event_created']
-                    csv_writer.writerow([primary_key, row['targetName'], row['response'], row['event_created'],
-                                         row['retrieved_date_time'], row['delivery_status']])
-
-        except Exception as e:
-            log.error('Exception while writing to csv file name: ' + str(
-                config.responses['file_name']) + ' with exception: ' + str(e))
+    log.info('Found Number of Rows for User Delivery Data: ' + str(csv_writer.count))
+    log.info('targetName lookups served from cache: ' + str(identity_cache.hits) + ', requested: ' + str(identity_cache.misses))
 
 
 if __name__ == "__main__":
@@ -205,13 +281,23 @@ if __name__ == "__main__":
     log.info("Starting Process: " + time_util.format_date_time_now(start))
 
     # instantiate classes
-    environment = xmatters.xMattersAPI(config.environment["url"], config.environment["username"],
-                                       config.environment["password"])
+    controller = integrator.ConcurrencyController(config.concurrency["initial"], config.concurrency["minimum"], config.concurrency["maximum"],
+                                                  config.concurrency["target_latency"], config.concurrency["adaptive"])
+    transport = integrator.Transport(config.transport["pool_size"], config.transport["gzip"], controller)
+    environment = integrator.xMattersTransportAPI(config.environment["url"], config.environment["username"],
+                                                  config.environment["password"], transport)
     xm_event = xmatters.xMattersEvent(environment)
-    xm_collection = xmatters.xMattersCollection(environment)
     xm_person = xmatters.xMattersPerson(environment)
+    # the pages of every event share the concurrency, which never exceeds the connections of the transport
+    async_collection = integrator.xMattersAsyncCollection(min(controller.get_thread_count(config.responses['concurrency']), config.transport["pool_size"]))
+    identity_cache = integrator.IdentityCache(xm_person, controller.get_thread_count(config.responses['thread_count']), config.identity_cache['file_name'],
+                                              config.identity_cache['ttl'], config.identity_cache['max_size'])
 
     main()  # execute the main process
+    identity_cache.save()
+    async_collection.close()
+
+    transport.close()  # logs the connection reuse and the concurrency limits
 
     # end the duration
     end = time_util.get_time_now()
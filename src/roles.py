@@ -1,14 +1,23 @@
 # local imports
 import xmatters
+import integrator
 import config
 
 # python3 package imports
 import logging
-import base64
 import json
+import time
+import concurrent.futures
 from logging.handlers import RotatingFileHandler
 
 
+# execute the method and return its result together with the seconds it took
+def timed(method, *args):
+    start_time = time.time()
+    result = method(*args)
+    return result, time.time() - start_time
+
+
 # main process
 def main() -> object:
 
@@ -26,110 +35,135 @@ def main() -> object:
     for item in group_roles:
         for role in item["roles"]:
             roles.add(role)
-    role_filter = ",".join(roles)
-    people = xm_person.get_people_collection("&embed=roles&roles=" + role_filter) # execute search on users, people returns a list of the full xMatters person object record
-    log.debug("people: " + str(people))
 
-    # 2. query for all membership and build a list that contains dictionary with group name, set of unique users, and list of roles
-    # Example: [{"users": {"user_1","user_2","user_3",},"roles": ["Role_1", "Role_2"]}, {"users": {"user_4","user_5","user_6",},"roles": ["Role_2", "Role_3"]}]
-    unstructured_role_users_mapping = []
-    for item in group_roles:
-        users = xm_roster.get_roster_collection(item["group"])
-        if users:
-            unstructured_role_users_mapping.append({
-                "users": users,
-                "roles": item["roles"]
-            })
+    # a single query for every role, or one query per role when split, a person holding several roles is returned by each of their queries
+    if config.roles['split_role_query']:
+        role_filters = ["&embed=roles&roles=" + role for role in sorted(roles)]
+    else:
+        role_filters = ["&embed=roles&roles=" + ",".join(roles)]
+
+    # 1. and 2. every role query and every group roster is retrieved at once on a bounded pool, each timed on its own
+    with concurrent.futures.ThreadPoolExecutor(max_workers=controller.get_thread_count(config.roles['thread_count'])) as executor:
+        people_futures = [(role_filter, executor.submit(timed, xm_person.get_people_collection, role_filter)) for role_filter in role_filters]
+        roster_futures = [(item, executor.submit(timed, xm_roster.get_roster_collection, item["group"])) for item in group_roles]
+
+        people_by_id = {}
+        for role_filter, future in people_futures:
+            role_people, duration = future.result()
+            if role_people is None:
+                log.error("Failed to retrieve people for query: " + role_filter + ", no roles will be updated")
+                return "Role Query Failed"
+
+            log.info("Retrieved " + str(len(role_people)) + " people for query: " + role_filter + " in " + "{:.2f}".format(duration) + " seconds")
+            for person in role_people:
+                people_by_id[person["id"]] = person
+
+        people = list(people_by_id.values())  # people returns a list of the full xMatters person object record
+        log.debug("people: " + str(people))
+
+        # 2. query for all membership and build a list that contains dictionary with group name, set of unique users, and list of roles
+        # Example: [{"users": {"user_1","user_2","user_3",},"roles": ["Role_1", "Role_2"]}, {"users": {"user_4","user_5","user_6",},"roles": ["Role_2", "Role_3"]}]
+        unstructured_role_users_mapping = []
+        rosters = {}
+        for item, future in roster_futures:
+            users, duration = future.result()
+            log.info("Retrieved roster of group: " + item["group"] + " with " + str(len(users or [])) + " members in " + "{:.2f}".format(duration) + " seconds")
+            rosters[item["group"]] = users or set()
+            if users:
+                unstructured_role_users_mapping.append({
+                    "users": users,
+                    "roles": item["roles"]
+                })
     log.debug("unstructured_role_users_mapping: " + str(unstructured_role_users_mapping))
 
-    # 3. Now it"s time to normalize the above data to make it useful later in the process,
-    # Manipulating Example above: [{"role": "Role_1", "users": {"user_2", "user_3", "user_1"}}, {"role": "Role_2", "users": {"user_2", "user_3", "user_1", "user_6", "user_4", "user_5"}}, {"role": "Role_3", "users": {"user_6", "user_4", "user_5"}}]
-    role_users_mapping = []
-    for unstructured in unstructured_role_users_mapping:
-        for role in unstructured["roles"]:
-            if len(role_users_mapping) == 0:
-                role_users_mapping.append({
-                    "users": unstructured["users"],
-                    "role": role
-                })
-            else:
-                match = False
-                for structured in role_users_mapping:
-                    if structured["role"] == role:
-                        match = True
-                        structured["users"] = unstructured["users"].union(structured["users"])
-                if not match:
-                    role_users_mapping.append({
-                        "users": unstructured["users"],
-                        "role": role
-                    })
-
-    log.debug("role_users_mapping: " + str(role_users_mapping))
+    # the last run that completed without errors saw the same mapping, rosters and roles, so there's nothing to update,
+    # unless a full sweep is due, which looks up every member again
+    state_hash = role_state.get_state_hash(group_roles, rosters, people)
+    snapshot = role_state.get_snapshot()
+    full_sweep_at = time.time()
+    full_sweep_due = not snapshot or full_sweep_at - snapshot["full_sweep_at"] >= config.roles['full_sweep_interval']
+    if config.roles['skip_unchanged'] and role_state.is_unchanged(state_hash) and not full_sweep_due:
+        log.info("Role mapping, rosters and roles unchanged since the last run, skipping reconciliation")
+        return "No Changes"
+
+    # 3. Now it"s time to normalize the above data to make it useful later in the process, the reconciler indexes the users of each role
+    # and the roles of each user, Manipulating Example above: role_users: {"Role_1": {"user_1", "user_2", "user_3"}, "Role_2": {"user_1", ..., "user_6"}, "Role_3": {"user_4", "user_5", "user_6"}}
+    # user_roles: {"user_1": {"Role_1", "Role_2"}, ..., "user_6": {"Role_2", "Role_3"}}
+    reconciler = integrator.RoleReconciler(unstructured_role_users_mapping, config.roles['role_mapping']["default_role"])
+
+    log.debug("role_users_mapping: " + str(reconciler.role_users))
 
     # 4. We must find the users that need an elevated role but do not have an elevated role already
-    role_users = set()
-    for item in role_users_mapping:
-        for user in item['users']:
-            role_users.add(user)
+    role_users = reconciler.users
 
     people_users = set()
     for person in people:
         people_users.add(person["targetName"])
 
     diff_users = role_users.difference(people_users)
-    for user_name in diff_users:
-        person = xm_person.get_person(user_name)
-        if person:
-            people.append(person)
+
+    # a full sweep looks up every member without an elevated role, an incremental run only looks up the members that joined a group since
+    # the last run or that held a role then but not anymore, the people holding a role are always reconciled so their drift is corrected
+    mapping_hash = role_state.get_mapping_hash(group_roles)
+    if not config.roles['incremental'] or full_sweep_due or snapshot["mapping_hash"] != mapping_hash:
+        log.info("Running a full sweep of " + str(len(diff_users)) + " members without an elevated role")
+    else:
+        changed_users = set()
+        for group, users in rosters.items():
+            changed_users.update(users.symmetric_difference(snapshot["rosters"].get(group, [])))
+        drifted_users = diff_users.intersection(snapshot["holders"])
+        log.info("Incremental run, members changed: " + str(len(changed_users)) + ", members no longer holding a role: " + str(len(drifted_users)))
+
+        diff_users = diff_users.intersection(changed_users.union(drifted_users))
+        full_sweep_at = snapshot["full_sweep_at"]
+
+    # the missing users are requested in parallel, each request body only holds the person_id argument of get_person
+    failed_users = set()
+    if len(diff_users) > 0:
+        log.info("Requesting " + str(len(diff_users)) + " users without an elevated role")
+        diff_collection = xm_collection.create_collection(xm_person.get_person, [{"person_id": user_name} for user_name in sorted(diff_users)], controller.get_thread_count(config.roles['thread_count']))
+        for response in diff_collection["response"]:
+            people.append(response["response_body"])
+        if len(diff_collection["errors"]) > 0:
+            failed_users = set(error["person_id"] for error in diff_collection["errors"])
+            log.error("Failed to retrieve users: " + str(sorted(failed_users)))
 
     log.debug('Adding additional users to process that do not have an elevated role already: ' + str(people))
 
-    # 5. Loop through people, normalize data, add/remove roles, and if update required queue update
-    request_queue = []
-    for person in people:
-        update_required = False
-        request = {"data": {
-            "targetName": person["targetName"],
-            "id": person["id"],
-            "roles": []
-            }
-        }
-
-        # build role object to assist with comparisons
-        for role in person["roles"]["data"]:
-            request["data"]["roles"].append(role["name"])
-
-        # do add/remove
-        for role_user in role_users_mapping:
-            if request["data"]["targetName"] in role_user["users"] and role_user["role"] not in request["data"]["roles"]:
-                update_required = True
-                log.info("Adding " + role_user["role"] + " from user: " + request["data"]["targetName"])
-                request["data"]["roles"].append(role_user["role"])
-
-            elif request["data"]["targetName"] not in role_user["users"] and role_user["role"] in request["data"]["roles"]:
-                update_required = True
-                log.info("Removing " + role_user["role"] + " from user: " + request["data"]["targetName"])
-                request["data"]["roles"].remove(role_user["role"])
-
-        # set a default role if all roles are removed or just add the Standard User role by default if the user doesn't have it already
-        if (len(request["data"]["roles"]) == 0 and update_required) or config.roles['role_mapping']["default_role"] not in request["data"]["roles"]:
-            update_required = True
-            log.info("Adding Default Role to Standard User for user: " + request["data"]["targetName"])
-            request["data"]["roles"].append(config.roles['role_mapping']["default_role"])
-
-        if update_required:
-            log.info('Adding to the request_queue: ' + str(request))
-            request_queue.append(request)
+    # 5. Work out the roles to add/remove for every person in a single pass, only the people that require an update are returned
+    role_diff = reconciler.reconcile(people)
+    for change in role_diff:
+        for role in change["add"]:
+            log.info("Adding " + role + " to user: " + change["targetName"])
+        for role in change["remove"]:
+            log.info("Removing " + role + " from user: " + change["targetName"])
+
+    request_queue = role_diff.get_requests()
+    log.info("Roles added: " + str(role_diff.added) + ", removed: " + str(role_diff.removed) + " for " + str(len(role_diff)) + " users")
 
     # 6. Process the updates
     if len(request_queue) > 0:
         log.info("Executing updates with request_queue: " + str(request_queue))
-        process_collection = xm_collection.create_collection(xm_person.modify_person, request_queue, config.roles['thread_count'])
+        process_collection = xm_collection.create_collection(xm_person.modify_person, request_queue, controller.get_thread_count(config.roles['thread_count']))
 
         log.info("User update success: " + str(process_collection["response"]))
         log.info("User update failures: " + str(process_collection["errors"]))
+        update_errors = len(process_collection["errors"]) > 0
     else:
         log.info("No updates required")
+        update_errors = False
+
+    # only a run without update errors is remembered, otherwise the next run retries the failed updates, the state hash is only kept
+    # when no updates were required and no lookups failed as it describes the state before them, the next run confirms the updates and
+    # records the hash, the members whose lookup failed are left out of the snapshot so the next incremental run retries them as changed
+    if not update_errors:
+        role_state.set_state_hash(state_hash if len(request_queue) == 0 and len(failed_users) == 0 else None)
+        role_state.set_snapshot(mapping_hash, dict((group, users.difference(failed_users)) for group, users in rosters.items()),
+                                [person["targetName"] for person in people], full_sweep_at)
+        try:
+            role_state.save()
+        except Exception as e:
+            log.error("Exception while saving the role state with exception: " + str(e))
 
 # entry point when file initiated
 if __name__ == "__main__":
@@ -146,21 +180,29 @@ if __name__ == "__main__":
     log.info("Starting Process: " + time_util.format_date_time_now(start))
 
     # instantiate classes
-    environment = xmatters.xMattersAPI(config.environment["url"], config.environment["username"], config.environment["password"])
+    controller = integrator.ConcurrencyController(config.concurrency["initial"], config.concurrency["minimum"], config.concurrency["maximum"],
+                                                  config.concurrency["target_latency"], config.concurrency["adaptive"])
+    transport = integrator.Transport(config.transport["pool_size"], config.transport["gzip"], controller)
+    environment = integrator.xMattersTransportAPI(config.environment["url"], config.environment["username"], config.environment["password"], transport)
 
     xm_roster = xmatters.xMattersRoster(environment)
     xm_person = xmatters.xMattersPerson(environment)
     xm_libraries = xmatters.xMattersLibraries(environment)
     xm_collection = xmatters.xMattersCollection(environment)
 
-    # retrieve the group-roles mapping
+    # the role mapping and the state of the last run are kept locally between runs
+    role_state = integrator.RoleState(config.roles['state_file_name'])
+
+    # retrieve the group-roles mapping, the library is only decoded again when its content changed
     group_roles = None
     if config.roles['role_mapping']["enable_web_ui"]:
         libraries = xm_libraries.get_libraries(config.roles['role_mapping']["plan_name"])
-        for script in libraries["data"]:
+        mapping_script = None
+        for script in (libraries or {"data": []})["data"]:
             if script["name"] == config.roles['role_mapping']["library_name"]:
-                group_roles = json.loads(base64.b64decode(script["script"]))["data"]
+                mapping_script = script["script"]
                 break
+        group_roles = role_state.get_mapping(mapping_script)
     else:
         with open(config.roles['role_mapping']["local_file_name"]) as f:  # read the json file
             group_roles = json.load(f)["data"]
@@ -168,6 +210,8 @@ if __name__ == "__main__":
     if group_roles:
         main()  # execute the main process
 
+    transport.close()  # logs the connection reuse and the concurrency limits
+
     # end the duration
     end = time_util.get_time_now()
     log.info("Process Duration: " + time_util.get_diff(end, start))
@@ -0,0 +1,5 @@
+# the scripts and the integrator package are run from src
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
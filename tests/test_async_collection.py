@@ -0,0 +1,41 @@
+# standard python modules
+import concurrent.futures
+import threading
+import time
+
+# local imports
+import integrator
+
+
+# page method counting the requests in flight at once
+class CountingEvent(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    def get_user_deliveries(self, event_id, url_filter):
+        with self.lock:
+            self.in_flight = self.in_flight + 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight = self.in_flight - 1
+        return {"data": [event_id]}
+
+
+def test_concurrency_is_shared_by_every_call():
+    xm_event = CountingEvent()
+    async_collection = integrator.xMattersAsyncCollection(5)
+
+    def get_collection(event_id):
+        return async_collection.get_collection(xm_event.get_user_deliveries, 200, 10, {"url_filter": "at=now", "event_id": event_id})
+
+    # four events at once, as the event pool of responses.py
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        collections = list(executor.map(get_collection, ["1", "2", "3", "4"]))
+    async_collection.close()
+
+    assert [len(collection["response"]) for collection in collections] == [20, 20, 20, 20]
+    assert xm_event.most_in_flight <= 5
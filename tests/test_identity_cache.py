@@ -0,0 +1,47 @@
+# standard python modules
+import collections
+import concurrent.futures
+import threading
+import time
+
+# local imports
+import integrator
+
+
+# counts the requests of each person, each request is slow enough for the threads to overlap
+class CountingPerson(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+
+    def get_person(self, person_id):
+        with self.lock:
+            self.calls[person_id] = self.calls[person_id] + 1
+        time.sleep(0.01)
+        return {"id": person_id, "targetName": "name_" + person_id}
+
+
+def test_resolve_requests_each_id_once_across_threads():
+    xm_person = CountingPerson()
+    identity_cache = integrator.IdentityCache(xm_person, 5)
+    person_ids = [str(i) for i in range(75)]
+
+    # every event shares most of its responders with the others, as in responses.py
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(identity_cache.resolve, [person_ids[offset:] + person_ids[:offset] for offset in range(0, 40, 10)]))
+
+    assert sorted(xm_person.calls) == sorted(person_ids)
+    assert set(xm_person.calls.values()) == {1}
+    assert identity_cache.get_target_name("42") == "name_42"
+
+
+def test_lookups_wait_for_a_request_in_flight():
+    xm_person = CountingPerson()
+    identity_cache = integrator.IdentityCache(xm_person, 5)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        names = list(executor.map(identity_cache.get_target_name, ["1"] * 8))
+
+    assert names == ["name_1"] * 8
+    assert xm_person.calls["1"] == 1
@@ -0,0 +1,58 @@
+# standard python modules
+import collections
+
+# local imports
+import integrator
+
+
+# people search over a fixed set of people per search, counting the downloads and probes of each search
+class FakePeopleSearch(object):
+
+    def __init__(self, people):
+        self.people = people
+        self.downloads = collections.Counter()
+        self.probes = collections.Counter()
+        self.errors = []
+        self.totals = {}
+
+    def search(self, url_filters, page_size):
+        for url_filter in url_filters:
+            self.downloads[url_filter] = self.downloads[url_filter] + 1
+            self.totals[url_filter] = len(self.people[url_filter])
+            for person in self.people[url_filter]:
+                yield url_filter, person
+
+    def get_total(self, url_filter):
+        self.probes[url_filter] = self.probes[url_filter] + 1
+        return len(self.people[url_filter])
+
+
+def test_unchanged_probe_skips_the_download():
+    people_search = FakePeopleSearch({"?status=ACTIVE": [{"id": "1", "targetName": "a"}, {"id": "2", "targetName": "b"}]})
+    people_store = integrator.PeopleStore(":memory:", people_search, 7 * 24 * 60 * 60, True)
+
+    assert people_store.refresh(["?status=ACTIVE"], 100) == ["?status=ACTIVE"]
+    assert people_store.refresh(["?status=ACTIVE"], 100) == []
+    assert people_search.downloads["?status=ACTIVE"] == 1
+    assert people_search.probes["?status=ACTIVE"] == 1
+    assert len(list(people_store.get_people("?status=ACTIVE"))) == 2
+
+
+def test_changed_probe_downloads_again():
+    people_search = FakePeopleSearch({"?status=ACTIVE": [{"id": "1", "targetName": "a"}]})
+    people_store = integrator.PeopleStore(":memory:", people_search, 7 * 24 * 60 * 60, True)
+
+    people_store.refresh(["?status=ACTIVE"], 100)
+    people_search.people["?status=ACTIVE"].append({"id": "2", "targetName": "b"})
+
+    assert people_store.refresh(["?status=ACTIVE"], 100) == ["?status=ACTIVE"]
+    assert len(list(people_store.get_people("?status=ACTIVE"))) == 2
+
+
+def test_device_searches_are_always_downloaded():
+    people_search = FakePeopleSearch({"?status=ACTIVE&embed=devices": [{"id": "1", "targetName": "a"}]})
+    people_store = integrator.PeopleStore(":memory:", people_search, 7 * 24 * 60 * 60, True)
+
+    people_store.refresh(["?status=ACTIVE&embed=devices"], 100)
+    people_store.refresh(["?status=ACTIVE&embed=devices"], 100)
+    assert people_search.downloads["?status=ACTIVE&embed=devices"] == 2
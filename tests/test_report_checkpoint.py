@@ -0,0 +1,38 @@
+# standard python modules
+import json
+
+# local imports
+import integrator
+
+
+def test_rows_are_only_recorded_once_the_event_is_set(tmp_path):
+    file_name = str(tmp_path / "checkpoint.json")
+    checkpoint = integrator.ReportCheckpoint(file_name, "2020-04-15")
+
+    assert checkpoint.update_row("event_1", "user_1", "DELIVERED ")
+    assert not checkpoint.update_row("event_1", "user_1", "DELIVERED ")
+    checkpoint.save()
+    assert json.load(open(file_name))["events"] == {}
+
+    checkpoint.set_event("event_1", False)
+    checkpoint.save()
+
+    resumed = integrator.ReportCheckpoint(file_name, "2020-04-15")
+    assert not resumed.update_row("event_1", "user_1", "DELIVERED ")
+    assert resumed.update_row("event_1", "user_1", "RESPONDED Yes")
+
+
+def test_complete_events_drop_their_rows(tmp_path):
+    file_name = str(tmp_path / "checkpoint.json")
+    checkpoint = integrator.ReportCheckpoint(file_name, "2020-04-15")
+
+    checkpoint.update_row("event_1", "user_1", "DELIVERED ")
+    checkpoint.set_event("event_1", False)
+    checkpoint.update_row("event_1", "user_2", "DELIVERED ")
+    checkpoint.set_event("event_1", True)
+    assert checkpoint.unsaved == 2
+    checkpoint.save()
+    assert checkpoint.unsaved == 0
+
+    assert json.load(open(file_name))["events"] == {"event_1": {"complete": True, "rows": {}}}
+    assert integrator.ReportCheckpoint(file_name, "2020-04-15").is_complete("event_1")